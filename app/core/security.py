@@ -13,7 +13,8 @@ SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7일
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 모듈 로드 시 1회만 생성 (bcrypt cost는 기본값 12를 명시)
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=12, deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
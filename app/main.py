@@ -1,10 +1,19 @@
 # app/main.py
 
 import logging
+import os
+from contextlib import asynccontextmanager
 
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.database import engine, Base
+from fastapi.middleware.gzip import GZipMiddleware
+from app.core.database import engine, Base, upgrade_schema
+from app.core.security import pwd_context
+from app.rag.vectorstore import warm_up_qdrant
+from app.services import analysis_batch
+from app.services.analyzer import _get_client
+from app.services.pdf_parser import shutdown_pool as shutdown_pdf_pool
 from app.routers import auth, upload, chat, general, real_estate, assistant_router, notifications, contact, user, documents
 
 # 로깅 설정
@@ -12,11 +21,45 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
 )
+logger = logging.getLogger(__name__)
 
-# DB 테이블 자동 생성
-Base.metadata.create_all(bind=engine)
+# DB 테이블 자동 생성 (import 시점이 아닌 서버 기동 시 1회)
+# 스키마를 별도로 관리하는 환경에서는 AUTOCREATE_TABLES=0 으로 끌 수 있다
+AUTOCREATE_TABLES = os.getenv("AUTOCREATE_TABLES", "1") == "1"
 
-app = FastAPI()
+# sync 라우트가 도는 스레드풀 크기 (anyio 기본 40)
+# 분석 요청은 OpenAI 응답을 기다리며 스레드를 수십 초씩 점유하므로, 짧은 요청이 빈 스레드를 기다리지 않도록 넉넉히 잡는다
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "100"))
+
+
+def _warm_up() -> None:
+    """첫 요청이 클라이언트 생성/연결 비용을 떠안지 않도록 기동 시 미리 초기화 (실패해도 기동은 계속)."""
+    warm_up_qdrant()
+    try:
+        _get_client()
+    except Exception as e:
+        logger.warning("OpenAI 클라이언트 초기화 실패: %s", e)
+    try:
+        pwd_context.dummy_verify()  # bcrypt 백엔드 로드
+    except Exception as e:
+        logger.warning("bcrypt 초기화 실패: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    if AUTOCREATE_TABLES:
+        Base.metadata.create_all(bind=engine)
+        upgrade_schema()
+    logger.info("DB 커넥션 풀: %s", engine.pool.status())
+    _warm_up()
+    analysis_batch.start_poller()
+    yield
+    analysis_batch.stop_poller()
+    shutdown_pdf_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # TODO: 배포 시 allow_origins를 실제 프론트엔드 도메인으로 제한할 것
 # 예: allow_origins=["https://knockknock.app", "https://knockknock.vercel.app"]
@@ -26,8 +69,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 페이지네이션 커서 (브라우저에서 읽을 수 있도록)
 )
 
+# 1KB 이상 응답은 gzip 압축 (긴 채팅 기록/목록 응답의 전송량 절감, SSE는 Starlette가 자동 제외)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # 라우터 등록
 app.include_router(auth.router)
 app.include_router(upload.router)
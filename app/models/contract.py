@@ -1,6 +1,7 @@
 # Back/models.py
 
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum, JSON, Boolean, LargeBinary, Float, Index
+from sqlalchemy.ext.mutable import MutableList
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import TypeDecorator, CHAR
 from app.core.database import Base  # <--- ✅ app/core 폴더 안에 있는 것을 가져와야 함
@@ -8,17 +9,23 @@ import uuid
 import datetime
 
 # SQLite에서 UUID를 저장하기 위한 호환성 설정 (복잡해 보이면 무시하셔도 됩니다)
+# 하이픈 없는 32자리 hex로 저장 (키 길이 축소). 이전 36자리 형식 값도 읽을 수 있다.
 class GUID(TypeDecorator):
     impl = CHAR
     cache_ok = True  # <--- 이 줄을 추가하면 경고가 사라집니다.
     def load_dialect_impl(self, dialect):
-        return dialect.type_descriptor(CHAR(36))
+        return dialect.type_descriptor(CHAR(32))
     def process_bind_param(self, value, dialect):
         if value is None: return value
-        return str(value)
+        if isinstance(value, uuid.UUID): return value.hex
+        return uuid.UUID(value if isinstance(value, str) else str(value)).hex
     def process_result_value(self, value, dialect):
         if value is None: return value
-        return uuid.UUID(value)
+        return uuid.UUID(hex=value)
+
+def _utcnow() -> datetime.datetime:
+    # 기존 데이터와 동일하게 tz 없는 UTC 시각으로 저장 (datetime.utcnow 대체)
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
 class User(Base):
     __tablename__ = "users"
@@ -31,7 +38,7 @@ class User(Base):
 
     is_premium = Column(Boolean, default=False, nullable=False)
     
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
 
     # 문서와의 관계 설정 (사용자가 삭제되면 문서도 삭제? or 유지? -> 일단 유지)
     documents = relationship("Document", back_populates="owner")
@@ -39,104 +46,142 @@ class User(Base):
 # 1. 문서 테이블 (사용자가 업로드한 파일)
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # 검색/목록 조회: owner_id + status 필터 후 created_at 역순 정렬
+        Index("ix_documents_owner_status_created", "owner_id", "status", "created_at"),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     filename = Column(String(500), index=True)
     status = Column(String(20), default="uploaded")
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
     owner_id = Column(GUID(), ForeignKey("users.id"))
+    # 비동기(Batch API) 분석 요청 ID - 결과를 기다리는 동안 status='pending'
+    openai_batch_id = Column(String(64), nullable=True, index=True)
     owner = relationship("User", back_populates="documents")
     
-    # 관계 설정 (1:N)
-    clauses = relationship("Clause", back_populates="document")
+    # 관계 설정 (1:N) - 문서 삭제 시 하위 데이터는 DB의 ON DELETE CASCADE로 함께 삭제
+    clauses = relationship("Clause", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
+    embeddings = relationship("ClauseEmbedding", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
+    chat_sessions = relationship("ChatSession", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
+    notifications = relationship("Notification", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
 
 # 2. 조항 테이블 (제1조, 제2조...)
 class Clause(Base):
     __tablename__ = "clauses"
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    document_id = Column(GUID(), ForeignKey("documents.id"))
+    document_id = Column(GUID(), ForeignKey("documents.id", ondelete="CASCADE"), index=True)
     clause_number = Column(String(50))
     title = Column(String(300))
     body = Column(Text)
     
     # 관계 설정
     document = relationship("Document", back_populates="clauses")
-    analysis = relationship("ClauseAnalysis", uselist=False, back_populates="clause")
+    analysis = relationship("ClauseAnalysis", uselist=False, back_populates="clause", cascade="all, delete-orphan", passive_deletes=True)
 
 # 3. 분석 결과 테이블 (AI가 분석한 내용)
 class ClauseAnalysis(Base):
     __tablename__ = "clause_analysis"
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    clause_id = Column(GUID(), ForeignKey("clauses.id"))
+    clause_id = Column(GUID(), ForeignKey("clauses.id", ondelete="CASCADE"), index=True)
     
     risk_level = Column(String(10))
     summary = Column(Text)      # 위험 요약
     suggestion = Column(Text)   # 수정 제안
     
     # JSON 형태로 저장 (태그 등)
-    tags = Column(JSON, default=[]) 
+    # 행마다 새 리스트를 만들고(default=list), 리스트를 제자리에서 고쳐도 변경이 감지되도록 MutableList로 감싼다
+    tags = Column(MutableList.as_mutable(JSON), default=list)
     
     clause = relationship("Clause", back_populates="analysis")
 
 
 class ClauseEmbedding(Base):
     __tablename__ = "clause_embeddings"
+    __table_args__ = (
+        Index("ix_clause_emb_user_doc_created", "user_id", "document_id", "created_at"),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    clause_id = Column(GUID(), ForeignKey("clauses.id"), unique=True, index=True)
+    clause_id = Column(GUID(), ForeignKey("clauses.id", ondelete="CASCADE"), unique=True, index=True)
     user_id = Column(GUID(), ForeignKey("users.id"), index=True)
-    document_id = Column(GUID(), ForeignKey("documents.id"), index=True)
+    document_id = Column(GUID(), ForeignKey("documents.id", ondelete="CASCADE"), index=True)
     embedding_model = Column(String(100), default="text-embedding-3-small")
-    embedding_json = Column(Text)  # JSON serialized float list
+    embedding_json = Column(Text)  # JSON serialized float list (레거시 행 읽기 전용, 새로 쓰지 않음)
+    embedding_blob = Column(LargeBinary, nullable=True)  # float32 little-endian raw bytes
+    embedding_i8 = Column(LargeBinary, nullable=True)  # int8 양자화 벡터 (1차 후보 스코어링용)
+    embedding_scale = Column(Float, nullable=True)  # int8 역양자화 스케일 (vec ≈ i8 * scale)
+    embedding_norm = Column(Float, nullable=True)  # float32 벡터의 L2 norm (재계산 생략용)
     content = Column(Text)  # embedding source text
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    content_hash = Column(LargeBinary(32), nullable=True)  # blake2b(content) - 내용이 같으면 재임베딩 생략
+    created_at = Column(DateTime, default=_utcnow)
 
     clause = relationship("Clause")
     user = relationship("User")
-    document = relationship("Document")
+    document = relationship("Document", back_populates="embeddings")
 
 # 4. 채팅 세션 테이블
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # 세션 목록: WHERE user_id = ? ORDER BY created_at DESC LIMIT 20 을 정렬 없이 인덱스로 처리
+        Index("ix_chat_sessions_user_created", "user_id", "created_at"),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     user_id = Column(GUID(), ForeignKey("users.id"))
-    document_id = Column(GUID(), ForeignKey("documents.id"), nullable=True)  # 특정 문서 범위 (선택)
+    document_id = Column(GUID(), ForeignKey("documents.id", ondelete="CASCADE"), nullable=True)  # 특정 문서 범위 (선택)
     title = Column(String(200), default="새 상담")
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
 
     user = relationship("User")
-    document = relationship("Document")
-    messages = relationship("ChatMessage", back_populates="session", order_by="ChatMessage.created_at")
+    document = relationship("Document", back_populates="chat_sessions")
+    messages = relationship(
+        "ChatMessage",
+        back_populates="session",
+        order_by="ChatMessage.created_at",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
 # 5. 채팅 메시지 테이블
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # 세션 메시지 조회: WHERE session_id = ? ORDER BY created_at
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    session_id = Column(GUID(), ForeignKey("chat_sessions.id"))
+    session_id = Column(GUID(), ForeignKey("chat_sessions.id", ondelete="CASCADE"))
     role = Column(String(20))
     content = Column(Text)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
 
     session = relationship("ChatSession", back_populates="messages")
 
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        # 전체 목록: WHERE user_id = ? ORDER BY created_at DESC LIMIT 100
+        Index("ix_notifications_user_created", "user_id", "created_at"),
+        # 안 읽은 목록/모두 읽음: WHERE user_id = ? AND is_read = 0 (ORDER BY created_at DESC)
+        Index("ix_notifications_user_read_created", "user_id", "is_read", "created_at"),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     user_id = Column(GUID(), ForeignKey("users.id"), index=True, nullable=False)
-    document_id = Column(GUID(), ForeignKey("documents.id"), nullable=True)
+    document_id = Column(GUID(), ForeignKey("documents.id", ondelete="CASCADE"), nullable=True)
     title = Column(String(200), nullable=False)
     message = Column(Text, nullable=False)
     is_read = Column(Boolean, default=False, nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
 
     user = relationship("User")
-    document = relationship("Document")
+    document = relationship("Document", back_populates="notifications")
 
 
 class NotificationSetting(Base):
@@ -150,8 +195,8 @@ class NotificationSetting(Base):
     marketing_push = Column(Boolean, default=False, nullable=False)
     email_enabled = Column(Boolean, default=True, nullable=False)
     email_report = Column(Boolean, default=False, nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
+    updated_at = Column(DateTime, default=_utcnow, onupdate=_utcnow)
 
     user = relationship("User")
 
@@ -165,6 +210,6 @@ class ContactInquiry(Base):
     title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
     status = Column(String(20), default="pending")
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
 
     user = relationship("User")
@@ -1,7 +1,7 @@
 # app/models/schemas.py
 
 from pydantic import BaseModel, EmailStr, ConfigDict
-from typing import List, Optional
+from typing import Any, List, Optional
 from datetime import datetime
 import uuid
 
@@ -31,8 +31,21 @@ class DocumentResponse(BaseModel):
     status: str
     created_at: datetime
     risk_count: int
-    class Config:
-        from_attributes = True
+
+    model_config = ConfigDict(from_attributes=True)
+
+class AnalysisClauseResponse(BaseModel):
+    clause_number: Optional[str] = None
+    title: Optional[str] = None
+    original_text: str
+    risk_level: Optional[str] = None
+    summary: Optional[str] = None
+    suggestion: Optional[str] = None
+    legal_basis: Any = ''  # AI 응답 그대로 저장된 값 (보통 문자열)
+
+class AnalysisDetailResponse(BaseModel):
+    filename: Optional[str] = None
+    analysis: List[AnalysisClauseResponse]
 
 # --- Home Dashboard 관련 ---
 class HomeDashboardResponse(BaseModel):
@@ -55,8 +68,8 @@ class ChatMessageResponse(BaseModel):
     role: str
     content: str
     created_at: datetime
-    class Config:
-        from_attributes = True
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ChatCitation(BaseModel):
@@ -79,8 +92,8 @@ class ChatSessionResponse(BaseModel):
     title: str
     document_id: Optional[uuid.UUID] = None
     created_at: datetime
-    class Config:
-        from_attributes = True
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 class NotificationResponse(BaseModel):
@@ -91,8 +104,7 @@ class NotificationResponse(BaseModel):
     is_read: bool
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # --- [추가] 회원 정보 수정용 Schema ---
@@ -0,0 +1,92 @@
+# app/rag/embed_cache.py
+# 임베딩 결과 로컬 캐시 (content-addressed)
+# - key: blake2b(모델명 + "\0" + 텍스트), value: float32 raw bytes
+# - 같은 조항/질문을 다시 임베딩할 때 OpenAI 호출을 생략한다
+# - EMBED_CACHE_PATH="" 로 비활성화
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[2] / ".embed_cache.sqlite3"
+_DTYPE = np.dtype("<f4")
+
+_CONN: Optional[sqlite3.Connection] = None
+_CONN_FAILED = False
+_LOCK = threading.Lock()
+
+
+def _get_conn() -> Optional[sqlite3.Connection]:
+    global _CONN, _CONN_FAILED
+
+    if _CONN is not None or _CONN_FAILED:
+        return _CONN
+
+    path = os.getenv("EMBED_CACHE_PATH")
+    if path is None:
+        path = str(DEFAULT_CACHE_PATH)
+    if not path.strip():
+        _CONN_FAILED = True
+        return None
+
+    try:
+        conn = sqlite3.connect(path.strip(), check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        conn.commit()
+        _CONN = conn
+    except Exception as e:
+        _CONN_FAILED = True
+        logger.warning("임베딩 캐시를 열 수 없습니다. 캐시 없이 진행: %s", e)
+    return _CONN
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=32).digest()
+
+
+def get_many(keys: list[bytes]) -> dict[bytes, list[float]]:
+    conn = _get_conn()
+    if conn is None or not keys:
+        return {}
+
+    found: dict[bytes, list[float]] = {}
+    try:
+        with _LOCK:
+            # SQLite 바인드 변수 제한(999)을 넘지 않도록 나눠서 조회
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[bytes(key)] = np.frombuffer(vector, dtype=_DTYPE).tolist()
+    except Exception as e:
+        logger.warning("임베딩 캐시 조회 실패: %s", e)
+    return found
+
+
+def put_many(items: dict[bytes, list[float]]) -> None:
+    conn = _get_conn()
+    if conn is None or not items:
+        return
+
+    try:
+        with _LOCK:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+                [(key, np.asarray(vec, dtype=_DTYPE).tobytes()) for key, vec in items.items()],
+            )
+            conn.commit()
+    except Exception as e:
+        logger.warning("임베딩 캐시 저장 실패: %s", e)
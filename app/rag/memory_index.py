@@ -0,0 +1,162 @@
+# app/rag/memory_index.py
+# 사용자별 인메모리 벡터 인덱스 (brute-force fallback용)
+# - ClauseEmbedding의 int8 벡터로 한 번 만들어 두고 쿼리마다 행렬곱 1회로 후보를 추린다
+# - 다른 워커 프로세스의 쓰기/삭제는 (행 수, 최신 created_at) 시그니처로 감지해 재구성
+
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app.models.contract import ClauseEmbedding
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_USERS = 64
+MAX_INDEX_VECTORS = 5000
+
+
+@dataclass
+class _UserIndex:
+    signature: tuple[int, Optional[datetime]]
+    clause_ids: list[uuid.UUID]
+    matrix: np.ndarray  # (N, D) float32, 행별 L2 정규화된 int8 벡터
+    doc_rows: dict[uuid.UUID, np.ndarray]  # document_id -> 행 인덱스
+    legacy_clause_ids: list[uuid.UUID]  # int8 벡터가 없는 레거시 행
+    legacy_doc_ids: list[uuid.UUID]
+
+
+_INDEXES: "OrderedDict[uuid.UUID, _UserIndex]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _signature(db: Session, user_id: uuid.UUID) -> tuple[int, Optional[datetime]]:
+    count, latest = (
+        db.query(func.count(ClauseEmbedding.id), func.max(ClauseEmbedding.created_at))
+        .filter(ClauseEmbedding.user_id == user_id)
+        .one()
+    )
+    return int(count or 0), latest
+
+
+def _build(db: Session, user_id: uuid.UUID, signature: tuple[int, Optional[datetime]]) -> _UserIndex:
+    rows = (
+        db.query(ClauseEmbedding.clause_id, ClauseEmbedding.document_id, ClauseEmbedding.embedding_i8)
+        .filter(ClauseEmbedding.user_id == user_id)
+        .order_by(ClauseEmbedding.created_at.desc())
+        .limit(MAX_INDEX_VECTORS)
+        .all()
+    )
+
+    clause_ids: list[uuid.UUID] = []
+    vectors: list[np.ndarray] = []
+    doc_rows: dict[uuid.UUID, list[int]] = {}
+    legacy_clause_ids: list[uuid.UUID] = []
+    legacy_doc_ids: list[uuid.UUID] = []
+    dim = None
+    for clause_id, document_id, i8 in rows:
+        if not i8 or (dim is not None and len(i8) != dim):
+            legacy_clause_ids.append(clause_id)
+            legacy_doc_ids.append(document_id)
+            continue
+        dim = len(i8)
+        doc_rows.setdefault(document_id, []).append(len(clause_ids))
+        clause_ids.append(clause_id)
+        vectors.append(np.frombuffer(i8, dtype=np.int8))
+
+    if vectors:
+        matrix = np.stack(vectors).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0.0, 1.0, norms)
+    else:
+        matrix = np.empty((0, 0), dtype=np.float32)
+
+    return _UserIndex(
+        signature=signature,
+        clause_ids=clause_ids,
+        matrix=matrix,
+        doc_rows={doc_id: np.asarray(idx, dtype=np.intp) for doc_id, idx in doc_rows.items()},
+        legacy_clause_ids=legacy_clause_ids,
+        legacy_doc_ids=legacy_doc_ids,
+    )
+
+
+def _get_index(db: Session, user_id: uuid.UUID) -> _UserIndex:
+    signature = _signature(db, user_id)
+    with _LOCK:
+        index = _INDEXES.get(user_id)
+        if index is not None and index.signature == signature:
+            _INDEXES.move_to_end(user_id)
+            return index
+
+    index = _build(db, user_id, signature)
+    with _LOCK:
+        _INDEXES[user_id] = index
+        _INDEXES.move_to_end(user_id)
+        while len(_INDEXES) > MAX_CACHED_USERS:
+            _INDEXES.popitem(last=False)
+    logger.info("인메모리 인덱스 구성: user_id=%s, 벡터 %d개", user_id, len(index.clause_ids))
+    return index
+
+
+def shortlist_clause_ids(
+    db: Session,
+    *,
+    user_id: uuid.UUID,
+    query_embedding: list[float],
+    document_id: Optional[uuid.UUID],
+    limit: int,
+) -> list[uuid.UUID]:
+    """근사(int8) 코사인 유사도 상위 limit개 + 레거시 행의 clause_id를 반환. 정확한 점수는 호출 측에서 재계산."""
+    index = _get_index(db, user_id)
+
+    legacy = [
+        clause_id
+        for clause_id, doc_id in zip(index.legacy_clause_ids, index.legacy_doc_ids)
+        if document_id is None or doc_id == document_id
+    ]
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    if index.matrix.size == 0 or index.matrix.shape[1] != query.shape[0]:
+        return legacy
+
+    if document_id is None:
+        rows = None
+        matrix = index.matrix
+    else:
+        rows = index.doc_rows.get(document_id)
+        if rows is None:
+            return legacy
+        matrix = index.matrix[rows]
+
+    q_norm = float(np.linalg.norm(query))
+    if q_norm == 0.0:
+        return legacy
+    scores = matrix @ (query / q_norm)
+
+    k = min(max(limit, 1), scores.shape[0])
+    top = np.argpartition(-scores, k - 1)[:k]
+    if rows is not None:
+        top = rows[top]
+    return legacy + [index.clause_ids[i] for i in top]
+
+
+def invalidate_user(user_id: Optional[uuid.UUID]) -> None:
+    if user_id is None:
+        return
+    with _LOCK:
+        _INDEXES.pop(user_id, None)
+
+
+@event.listens_for(ClauseEmbedding, "after_insert")
+@event.listens_for(ClauseEmbedding, "after_update")
+@event.listens_for(ClauseEmbedding, "after_delete")
+def _on_embedding_change(mapper, connection, target: ClauseEmbedding) -> None:
+    invalidate_user(target.user_id)
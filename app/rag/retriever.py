@@ -1,27 +1,39 @@
 # app/rag/retriever.py
 # Qdrant 기반 검색 + fallback + threshold + rerank + citation
 
-import json
 import logging
-import math
 import re
 import uuid
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
-from sqlalchemy.orm import Session
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session, selectinload
 
 from app.models.contract import Clause, ClauseAnalysis, ClauseEmbedding, Document
-from app.rag.vectorstore import create_query_embedding, search_similar_clauses
+from app.rag.memory_index import shortlist_clause_ids
+from app.rag.vectorstore import create_query_embedding, load_embedding, search_similar_clauses
 
 logger = logging.getLogger(__name__)
 
 MAX_CLAUSES = 50
-MAX_VECTOR_CANDIDATES = 500
+CONTEXT_BODY_CHARS = 500
+RERANK_POOL = 64  # int8 1차 스코어링 후 float32로 재계산할 후보 수
 DEFAULT_CANDIDATE_K = 30
 DEFAULT_TOP_K = 6
 DEFAULT_MIN_SIMILARITY = 0.35
 
+_TOKEN_PATTERN = re.compile(r"[0-9A-Za-z가-힣]{2,}")
+
+_RISK_LABEL = {
+    "HIGH": "🔴 위험",
+    "MEDIUM": "🟡 주의",
+    "LOW": "🟢 안전",
+}
+_CONTEXT_BLOCK = "\n[{} - {}]\n- 위험도: {} ({})\n- 분석 요약: {}\n- 수정 제안: {}"
+
 
 @dataclass
 class Citation:
@@ -40,25 +52,38 @@ class RetrievalResult:
     citations: list[Citation]
 
 
-def _cosine_similarity(a: list[float], b: list[float]) -> float:
-    if not a or not b or len(a) != len(b):
-        return -1.0
+@lru_cache(maxsize=2048)
+def _cached_query_embedding(query_text: str) -> tuple[float, ...]:
+    """같은 질문이 반복되면 임베딩 API를 다시 호출하지 않는다. (API 예외는 캐시되지 않음)"""
+    return tuple(create_query_embedding(query_text))
+
+
+def embed_query(query_text: str) -> list[float]:
+    return list(_cached_query_embedding((query_text or "").strip()))
+
 
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(y * y for y in b))
-    if norm_a == 0.0 or norm_b == 0.0:
-        return -1.0
-    return dot / (norm_a * norm_b)
+def _cosine_similarities(
+    query: np.ndarray,
+    matrix: np.ndarray,
+    row_norms: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """query (D,) 와 matrix (N, D) 의 코사인 유사도를 한 번의 행렬곱으로 계산. norm이 0이면 -1."""
+    query_norm = float(np.linalg.norm(query))
+    if query_norm == 0.0 or matrix.size == 0:
+        return np.full(matrix.shape[0], -1.0, dtype=np.float32)
 
+    if row_norms is None:
+        row_norms = np.linalg.norm(matrix, axis=1)
+    sims = (matrix @ query) / np.where(row_norms == 0.0, 1.0, row_norms * query_norm)
+    sims[row_norms == 0.0] = -1.0
+    return sims
 
-def _tokenize(text: str) -> set[str]:
-    tokens = re.findall(r"[0-9A-Za-z가-힣]{2,}", (text or "").lower())
-    return set(tokens)
 
+def _tokenize(text: str) -> frozenset[str]:
+    return frozenset(m.group(0) for m in _TOKEN_PATTERN.finditer((text or "").lower()))
 
-def _lexical_score(query_text: str, row: tuple[Clause, ClauseAnalysis, Document]) -> float:
-    query_tokens = _tokenize(query_text)
+
+def _lexical_score(query_tokens: frozenset[str], row: tuple[Clause, ClauseAnalysis, Document]) -> float:
     if not query_tokens:
         return 0.0
 
@@ -69,7 +94,7 @@ def _lexical_score(query_text: str, row: tuple[Clause, ClauseAnalysis, Document]
             clause.title or "",
             analysis.summary or "",
             analysis.suggestion or "",
-            (clause.body or "")[:500],
+            (clause.body or "")[:CONTEXT_BODY_CHARS],
         ]
     )
     target_tokens = _tokenize(target)
@@ -88,35 +113,57 @@ def _risk_boost(risk_level: str) -> float:
     return 0.0
 
 
-def _format_context_rows(rows: list[tuple[Clause, ClauseAnalysis, Document]]) -> str:
+@dataclass
+class _ContextRow:
+    """컨텍스트 블록 1개에 필요한 컬럼만 모은 행. build_contract_context의 SQL Row와 같은 속성 이름을 쓴다."""
+    document_id: uuid.UUID
+    filename: str
+    clause_number: Optional[str]
+    title: Optional[str]
+    body: Optional[str]  # 앞 CONTEXT_BODY_CHARS자만
+    risk_level: Optional[str]
+    summary: Optional[str]
+    suggestion: Optional[str]
+
+
+def _to_context_row(row: tuple[Clause, ClauseAnalysis, Document]) -> _ContextRow:
+    clause, analysis, doc = row
+    return _ContextRow(
+        document_id=doc.id,
+        filename=doc.filename,
+        clause_number=clause.clause_number,
+        title=clause.title,
+        body=(clause.body or "")[:CONTEXT_BODY_CHARS],
+        risk_level=analysis.risk_level,
+        summary=analysis.summary,
+        suggestion=analysis.suggestion,
+    )
+
+
+def _format_context_rows(rows: list[_ContextRow]) -> str:
     if not rows:
         return "아직 분석된 계약서 데이터가 없습니다."
 
     context_parts = []
     current_doc = None
 
-    for clause, analysis, doc in rows:
-        if current_doc != doc.id:
-            current_doc = doc.id
-            context_parts.append(f"\n=== 문서: {doc.filename} ===")
-
-        risk_label = {
-            "HIGH": "🔴 위험",
-            "MEDIUM": "🟡 주의",
-            "LOW": "🟢 안전",
-        }.get(analysis.risk_level, "미분류")
-
-        block = (
-            f"\n[{clause.clause_number} - {clause.title}]\n"
-            f"- 위험도: {analysis.risk_level} ({risk_label})\n"
-            f"- 분석 요약: {analysis.summary}\n"
-            f"- 수정 제안: {analysis.suggestion}"
+    for row in rows:
+        if current_doc != row.document_id:
+            current_doc = row.document_id
+            context_parts.append(f"\n=== 문서: {row.filename} ===")
+
+        context_parts.append(
+            _CONTEXT_BLOCK.format(
+                row.clause_number,
+                row.title,
+                row.risk_level,
+                _RISK_LABEL.get(row.risk_level, "미분류"),
+                row.summary,
+                row.suggestion,
+            )
         )
-
-        if clause.body:
-            block += f"\n- 원문: {clause.body[:500]}"
-
-        context_parts.append(block)
+        if row.body:
+            context_parts.append("- 원문: " + row.body)
 
     return "\n".join(context_parts)
 
@@ -127,8 +174,19 @@ def build_contract_context(
     document_id: Optional[uuid.UUID] = None,
     clause_ids: Optional[list[uuid.UUID]] = None,
 ) -> str:
+    # 컨텍스트에 쓰는 컬럼만 조회하고, 원문은 DB에서 잘라서 가져온다
     query = (
-        db.query(Clause, ClauseAnalysis, Document)
+        db.query(
+            Document.id.label("document_id"),
+            Document.filename,
+            Clause.clause_number,
+            Clause.title,
+            func.substr(Clause.body, 1, CONTEXT_BODY_CHARS).label("body"),
+            ClauseAnalysis.risk_level,
+            ClauseAnalysis.summary,
+            ClauseAnalysis.suggestion,
+        )
+        .select_from(Clause)
         .join(ClauseAnalysis, ClauseAnalysis.clause_id == Clause.id)
         .join(Document, Document.id == Clause.document_id)
         .filter(Document.owner_id == user_id)
@@ -153,33 +211,51 @@ def _fallback_bruteforce_search(
     candidate_k: int,
     min_similarity: float,
 ) -> list[tuple[uuid.UUID, float]]:
-    candidate_query = db.query(ClauseEmbedding).filter(ClauseEmbedding.user_id == user_id)
-    if document_id:
-        candidate_query = candidate_query.filter(ClauseEmbedding.document_id == document_id)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    dim = query.shape[0]
 
-    candidates = (
-        candidate_query.order_by(ClauseEmbedding.created_at.desc())
-        .limit(MAX_VECTOR_CANDIDATES)
-        .all()
+    # 1차: 사용자별 인메모리 int8 인덱스에서 후보 축소 (양자화 전 레거시 행은 그대로 2차로 넘김)
+    shortlist = shortlist_clause_ids(
+        db,
+        user_id=user_id,
+        query_embedding=query_embedding,
+        document_id=document_id,
+        limit=max(candidate_k, RERANK_POOL),
     )
-    if not candidates:
+    if not shortlist:
         return []
 
-    scored: list[tuple[float, uuid.UUID]] = []
-    for item in candidates:
+    # 2차: 추린 후보만 float32 원본으로 정확한 코사인 유사도 재계산
+    items = db.query(ClauseEmbedding).filter(ClauseEmbedding.clause_id.in_(shortlist)).all()
+    clause_ids: list[uuid.UUID] = []
+    vectors: list[np.ndarray] = []
+    norms: list[float] = []
+    for item in items:
         try:
-            emb = json.loads(item.embedding_json)
-            if not isinstance(emb, list):
-                continue
-            sim = _cosine_similarity(query_embedding, emb)
-            if sim >= min_similarity:
-                scored.append((sim, item.clause_id))
+            emb = load_embedding(item)
         except Exception as e:
             logger.warning("brute-force 임베딩 파싱 실패 (clause_id=%s): %s", item.clause_id, e)
             continue
+        if emb is None or emb.shape[0] != dim:
+            continue
+        clause_ids.append(item.clause_id)
+        vectors.append(emb)
+        # 저장 시 계산해 둔 norm 사용 (레거시 행만 여기서 계산)
+        norms.append(item.embedding_norm if item.embedding_norm is not None else float(np.linalg.norm(emb)))
+    if not vectors:
+        return []
+
+    matrix = np.stack(vectors)
+    sims = _cosine_similarities(query, matrix, np.asarray(norms, dtype=np.float32))
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [(clause_id, score) for score, clause_id in scored[: max(candidate_k, 1)]]
+    k = min(max(candidate_k, 1), len(sims))
+    top_idx = np.argpartition(-sims, k - 1)[:k]
+    top_idx = top_idx[np.argsort(-sims[top_idx])]
+    return [
+        (clause_ids[i], float(sims[i]))
+        for i in top_idx
+        if sims[i] >= min_similarity
+    ]
 
 
 def _fetch_rows_for_clause_ids(
@@ -192,17 +268,25 @@ def _fetch_rows_for_clause_ids(
     if not clause_ids:
         return []
 
-    row_query = (
-        db.query(Clause, ClauseAnalysis, Document)
-        .join(ClauseAnalysis, ClauseAnalysis.clause_id == Clause.id)
-        .join(Document, Document.id == Clause.document_id)
-        .filter(Document.owner_id == user_id)
-        .filter(Document.status == "done")
+    # 후보 수가 적으므로 조인 대신 관계별 IN 쿼리로 로드하고 소유자/상태는 Python에서 거른다
+    # 결과는 clause_ids(벡터 점수) 순서를 유지한다
+    rank = case(*[(Clause.id == clause_id, i) for i, clause_id in enumerate(clause_ids)])
+    clauses = (
+        db.query(Clause)
+        .options(selectinload(Clause.analysis), selectinload(Clause.document))
         .filter(Clause.id.in_(clause_ids))
+        .order_by(rank)
+        .all()
     )
-    if document_id:
-        row_query = row_query.filter(Document.id == document_id)
-    return row_query.all()
+    return [
+        (clause, clause.analysis, clause.document)
+        for clause in clauses
+        if clause.analysis is not None
+        and clause.document is not None
+        and clause.document.owner_id == user_id
+        and clause.document.status == "done"
+        and (not document_id or clause.document.id == document_id)
+    ]
 
 
 def retrieve_relevant_context(
@@ -216,7 +300,7 @@ def retrieve_relevant_context(
     candidate_k: int = DEFAULT_CANDIDATE_K,
     use_rerank: bool = True,
 ) -> RetrievalResult:
-    query_embedding = create_query_embedding(query_text)
+    query_embedding = embed_query(query_text)
     if not query_embedding:
         return RetrievalResult(
             context=build_contract_context(db, user_id, document_id),
@@ -261,22 +345,17 @@ def retrieve_relevant_context(
         )
 
     # 기본 순서: 벡터 점수 순
-    ranked_rows: list[tuple[float, tuple[Clause, ClauseAnalysis, Document]]] = []
-    for row in rows:
-        clause, analysis, _ = row
-        v_score = vector_score_map.get(clause.id, 0.0)
-
-        if use_rerank:
-            l_score = _lexical_score(query_text, row)
-            score = (0.75 * v_score) + (0.20 * l_score) + _risk_boost(analysis.risk_level)
-        else:
-            score = v_score
-        ranked_rows.append((score, row))
+    scores = np.array([vector_score_map.get(clause.id, 0.0) for clause, _, _ in rows], dtype=np.float64)
+    if use_rerank:
+        query_tokens = _tokenize(query_text)
+        lexical = np.array([_lexical_score(query_tokens, row) for row in rows], dtype=np.float64)
+        boost = np.array([_risk_boost(analysis.risk_level) for _, analysis, _ in rows], dtype=np.float64)
+        scores = (0.75 * scores) + (0.20 * lexical) + boost
 
-    ranked_rows.sort(key=lambda x: x[0], reverse=True)
-    selected_rows = [row for _, row in ranked_rows[: max(top_k, 1)]]
+    order = np.argsort(-scores, kind="stable")[: max(top_k, 1)]
+    selected_rows = [rows[i] for i in order]
 
-    context = _format_context_rows(selected_rows)
+    context = _format_context_rows([_to_context_row(row) for row in selected_rows])
     citations = [
         Citation(
             clause_id=clause.id,
@@ -285,8 +364,8 @@ def retrieve_relevant_context(
             clause_number=clause.clause_number or "미분류",
             clause_title=clause.title or "제목 없음",
             risk_level=analysis.risk_level or "UNKNOWN",
-            score=round(score, 4),
+            score=round(float(scores[i]), 4),
         )
-        for score, (clause, analysis, doc) in ranked_rows[: max(top_k, 1)]
+        for i, (clause, analysis, doc) in zip(order, selected_rows)
     ]
     return RetrievalResult(context=context, citations=citations)
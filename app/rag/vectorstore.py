@@ -1,19 +1,38 @@
+import hashlib
 import logging
 import os
 import json
 import uuid
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.models.contract import Clause, ClauseAnalysis, ClauseEmbedding, Document
+from app.rag import embed_cache
 from app.services.analyzer import _get_client
 
+try:
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models as qmodels
+except Exception:
+    QdrantClient = None
+    qmodels = None
+
 logger = logging.getLogger(__name__)
 
 EMBEDDING_MODEL = "text-embedding-3-small"
 DEFAULT_QDRANT_COLLECTION = "readgye_clause_embeddings"
+EMBEDDING_DTYPE = np.dtype("<f4")  # float32 little-endian
+EMBEDDING_BATCH_SIZE = 128  # embeddings.create 1회에 보내는 최대 입력 수
+BACKFILL_CHUNK_SIZE = 500  # backfill 1회 조회/커밋 단위
+QDRANT_UPLOAD_BATCH = 64
+QDRANT_UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL", "4"))
+QDRANT_BULK_PAUSE_INDEXING_MIN = 1000  # backfill 대상이 이 개수 이상일 때만 전체 업로드 동안 인덱싱을 잠시 끈다
+QDRANT_INDEXING_THRESHOLD = 20000  # Qdrant 기본값 (KB)
 
 _QDRANT_CLIENT = None
 _QDRANT_IMPORT_FAILED = False
@@ -37,16 +56,72 @@ def _build_embedding_text(clause: Clause, analysis: Optional[ClauseAnalysis]) ->
     return "\n".join(parts).strip()
 
 
+def content_hash(content: str) -> bytes:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=32).digest()
+
+
+def embedding_to_blob(embedding: list[float]) -> bytes:
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def embedding_norm(embedding: list[float]) -> float:
+    return float(np.linalg.norm(np.asarray(embedding, dtype=EMBEDDING_DTYPE)))
+
+
+def quantize_embedding(embedding: list[float]) -> tuple[bytes, float]:
+    """벡터를 int8 + 스케일로 양자화 (float32 대비 1/4 크기)."""
+    vec = np.asarray(embedding, dtype=np.float32)
+    max_abs = float(np.max(np.abs(vec))) if vec.size else 0.0
+    scale = max_abs / 127.0 if max_abs > 0.0 else 1.0
+    quantized = np.clip(np.round(vec / scale), -127, 127).astype(np.int8)
+    return quantized.tobytes(), scale
+
+
+def load_embedding(item: ClauseEmbedding) -> Optional[np.ndarray]:
+    """저장된 임베딩을 float32 벡터로 복원. BLOB 우선, 없으면 레거시 JSON 컬럼을 파싱."""
+    if item.embedding_blob:
+        return np.frombuffer(item.embedding_blob, dtype=EMBEDDING_DTYPE)
+    if item.embedding_json:
+        emb = json.loads(item.embedding_json)
+        if isinstance(emb, list):
+            return np.asarray(emb, dtype=EMBEDDING_DTYPE)
+    return None
+
+
 def create_query_embedding(text: str) -> list[float]:
-    cleaned = (text or "").strip()
-    if not cleaned:
-        return []
+    return create_query_embeddings([text])[0]
+
+
+def create_query_embeddings(texts: list[str]) -> list[list[float]]:
+    """여러 텍스트를 EMBEDDING_BATCH_SIZE 단위로 묶어 임베딩. 빈 텍스트 자리는 []를 반환."""
+    cleaned = [(text or "").strip() for text in texts]
+    results: list[list[float]] = [[] for _ in cleaned]
+    keys = [embed_cache.cache_key(EMBEDDING_MODEL, text) if text else b"" for text in cleaned]
+
+    # 캐시 적중분은 그대로 쓰고, 나머지만 API로 임베딩
+    cached = embed_cache.get_many([key for key in keys if key])
+    pending = []
+    for i, key in enumerate(keys):
+        if not key:
+            continue
+        if key in cached:
+            results[i] = cached[key]
+        else:
+            pending.append(i)
+    if not pending:
+        return results
 
     client = _get_client()
-    response = client.embeddings.create(model=EMBEDDING_MODEL, input=cleaned)
-    return response.data[0].embedding
+    for start in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+        batch = pending[start:start + EMBEDDING_BATCH_SIZE]
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=[cleaned[i] for i in batch])
+        for item in response.data:
+            results[batch[item.index]] = item.embedding
+        embed_cache.put_many({keys[i]: results[i] for i in batch if results[i]})
+    return results
 
 
+@lru_cache(maxsize=1)
 def _get_qdrant_collection_name() -> str:
     return (os.getenv("QDRANT_COLLECTION") or DEFAULT_QDRANT_COLLECTION).strip()
 
@@ -59,9 +134,7 @@ def _get_qdrant_client():
     if _QDRANT_IMPORT_FAILED:
         return None
 
-    try:
-        from qdrant_client import QdrantClient
-    except Exception:
+    if QdrantClient is None:
         _QDRANT_IMPORT_FAILED = True
         logger.warning("qdrant-client 패키지를 임포트할 수 없습니다. Qdrant 비활성화.")
         return None
@@ -86,8 +159,8 @@ def _get_qdrant_client():
         return None
 
 
-def _ensure_payload_indexes(collection: str) -> None:
-    """user_id, document_id 필드에 payload 인덱스를 생성하여 필터 성능 향상."""
+def _ensure_payload_indexes(collection: str, *, created: bool = False) -> None:
+    """user_id, document_id 필드에 payload 인덱스를 생성하여 필터 성능 향상 (이미 있는 필드는 건너뜀)."""
     client = _get_qdrant_client()
     if client is None:
         return
@@ -96,18 +169,25 @@ def _ensure_payload_indexes(collection: str) -> None:
     if cache_key in _INDEXED_FIELDS:
         return
 
-    from qdrant_client.http import models as qmodels
+    try:
+        # 방금 만든 컬렉션은 인덱스가 없으므로 조회 생략
+        existing_fields = set() if created else set(client.get_collection(collection).payload_schema or {})
+    except Exception as e:
+        logger.warning("Qdrant payload 스키마 조회 실패: %s", e)
+        return
 
     for field_name in ("user_id", "document_id"):
+        if field_name in existing_fields:
+            continue
         try:
             client.create_payload_index(
                 collection_name=collection,
                 field_name=field_name,
                 field_schema=qmodels.PayloadSchemaType.KEYWORD,
             )
-        except Exception:
-            # 이미 존재하는 경우 무시
-            pass
+        except Exception as e:
+            logger.warning("Qdrant payload 인덱스 생성 실패 (%s): %s", field_name, e)
+            return
 
     _INDEXED_FIELDS.add(cache_key)
 
@@ -121,12 +201,9 @@ def _ensure_qdrant_collection(vector_size: int) -> None:
     if collection in _ENSURED_COLLECTIONS:
         return
 
-    from qdrant_client.http import models as qmodels
-
     try:
-        existing = client.get_collections()
-        names = {item.name for item in existing.collections}
-        if collection not in names:
+        created = False
+        if not client.collection_exists(collection):
             client.create_collection(
                 collection_name=collection,
                 vectors_config=qmodels.VectorParams(
@@ -134,32 +211,39 @@ def _ensure_qdrant_collection(vector_size: int) -> None:
                     distance=qmodels.Distance.COSINE,
                 ),
             )
+            created = True
             logger.info("Qdrant 컬렉션 생성: %s (size=%d)", collection, vector_size)
         _ENSURED_COLLECTIONS.add(collection)
-        _ensure_payload_indexes(collection)
+        _ensure_payload_indexes(collection, created=created)
     except Exception as e:
         logger.error("Qdrant 컬렉션 확인/생성 실패: %s", e)
 
 
-def _upsert_qdrant_clause(
-    *,
-    clause: Clause,
-    analysis: Optional[ClauseAnalysis],
-    user_id: uuid.UUID,
-    document_id: uuid.UUID,
-    embedding: list[float],
-    content: str,
-) -> None:
+def warm_up_qdrant() -> None:
+    """서버 기동 시 Qdrant 클라이언트 연결과 컬렉션 확인을 미리 수행 (첫 요청 지연 방지)."""
     client = _get_qdrant_client()
-    if client is None or not embedding:
+    if client is None:
         return
 
-    _ensure_qdrant_collection(len(embedding))
     collection = _get_qdrant_collection_name()
+    try:
+        # 벡터 차원은 첫 임베딩에서 정해지므로, 컬렉션이 이미 있을 때만 확인 처리
+        if client.collection_exists(collection):
+            _ENSURED_COLLECTIONS.add(collection)
+            _ensure_payload_indexes(collection)
+    except Exception as e:
+        logger.warning("Qdrant 워밍업 실패: %s", e)
 
-    from qdrant_client.http import models as qmodels
 
-    payload = {
+def _build_qdrant_payload(
+    *,
+    clause: Clause,
+    analysis: Optional[ClauseAnalysis],
+    user_id: uuid.UUID,
+    document_id: uuid.UUID,
+    content: str,
+) -> dict:
+    return {
         "clause_id": str(clause.id),
         "user_id": str(user_id),
         "document_id": str(document_id),
@@ -171,15 +255,41 @@ def _upsert_qdrant_clause(
         "content": content,
     }
 
-    point = qmodels.PointStruct(
-        id=str(clause.id),
-        vector=embedding,
-        payload=payload,
-    )
+
+def bulk_upsert_clauses(ids: list[str], vectors: list[list[float]], payloads: list[dict]) -> None:
+    """여러 포인트를 upload_collection으로 한 번에 전송 (QDRANT_UPLOAD_BATCH개 단위, 원격은 병렬 업로드)."""
+    client = _get_qdrant_client()
+    if client is None or not ids:
+        return
+
+    _ensure_qdrant_collection(len(vectors[0]))
+    # 로컬(path) 모드는 멀티프로세스 업로드를 지원하지 않으므로 단일 워커로 처리
+    parallel = QDRANT_UPLOAD_PARALLEL if _is_remote_qdrant() else 1
     try:
-        client.upsert(collection_name=collection, points=[point], wait=False)
+        client.upload_collection(
+            collection_name=_get_qdrant_collection_name(),
+            ids=ids,
+            vectors=vectors,
+            payload=payloads,
+            batch_size=QDRANT_UPLOAD_BATCH,
+            parallel=parallel,
+        )
     except Exception as e:
-        logger.error("Qdrant upsert 실패 (clause_id=%s): %s", clause.id, e)
+        logger.error("Qdrant 일괄 업로드 실패 (%d개): %s", len(ids), e)
+
+
+def _is_remote_qdrant() -> bool:
+    return bool((os.getenv("QDRANT_URL") or "").strip())
+
+
+def _set_indexing_threshold(client, collection: str, threshold: int) -> None:
+    try:
+        client.update_collection(
+            collection_name=collection,
+            optimizers_config=qmodels.OptimizersConfigDiff(indexing_threshold=threshold),
+        )
+    except Exception as e:
+        logger.error("Qdrant indexing_threshold=%d 설정 실패: %s", threshold, e)
 
 
 def search_similar_clauses(
@@ -187,6 +297,7 @@ def search_similar_clauses(
     query_embedding: list[float],
     user_id: uuid.UUID,
     document_id: Optional[uuid.UUID] = None,
+    clause_ids: Optional[list[uuid.UUID]] = None,
     limit: int = 30,
     score_threshold: Optional[float] = None,
 ) -> list[tuple[uuid.UUID, float]]:
@@ -194,10 +305,9 @@ def search_similar_clauses(
     if client is None or not query_embedding:
         return []
 
+    # 컬렉션과 user_id/document_id KEYWORD 인덱스를 보장한 뒤 검색
     _ensure_qdrant_collection(len(query_embedding))
 
-    from qdrant_client.http import models as qmodels
-
     must_conditions = [
         qmodels.FieldCondition(
             key="user_id",
@@ -211,22 +321,25 @@ def search_similar_clauses(
                 match=qmodels.MatchValue(value=str(document_id)),
             )
         )
+    if clause_ids:
+        # point id == clause_id 이므로 payload 매칭 대신 id 조건으로 좁힌다
+        must_conditions.append(qmodels.HasIdCondition(has_id=[str(cid) for cid in clause_ids]))
 
     try:
-        points = client.search(
+        response = client.query_points(
             collection_name=_get_qdrant_collection_name(),
-            query_vector=query_embedding,
+            query=query_embedding,
             query_filter=qmodels.Filter(must=must_conditions),
             limit=max(limit, 1),
             score_threshold=score_threshold,
-            with_payload=True,
+            with_payload=["clause_id"],
         )
     except Exception as e:
         logger.error("Qdrant 검색 실패 (user_id=%s): %s", user_id, e)
         return []
 
     results: list[tuple[uuid.UUID, float]] = []
-    for point in points:
+    for point in response.points:
         try:
             payload = point.payload or {}
             clause_id_raw = payload.get("clause_id") or point.id
@@ -237,36 +350,29 @@ def search_similar_clauses(
     return results
 
 
-def upsert_clause_embedding(
+def _save_embedding_row(
     db: Session,
     *,
     clause: Clause,
-    analysis: Optional[ClauseAnalysis],
     user_id: uuid.UUID,
     document_id: uuid.UUID,
+    content: str,
+    embedding: list[float],
+    existing: Optional[ClauseEmbedding] = None,
 ) -> None:
-    content = _build_embedding_text(clause, analysis)
-    if not content:
-        return
-
-    embedding = create_query_embedding(content)
-    if not embedding:
-        logger.warning("임베딩 생성 실패 (clause_id=%s)", clause.id)
-        return
-
-    existing = (
-        db.query(ClauseEmbedding)
-        .filter(ClauseEmbedding.clause_id == clause.id)
-        .first()
-    )
-
+    """existing이 있으면 그 행을 갱신하고, 없으면 새 행을 추가한다."""
     if existing:
         existing.embedding_model = EMBEDDING_MODEL
-        existing.embedding_json = json.dumps(embedding)
+        existing.embedding_json = None  # 레거시 JSON 사본 제거 (BLOB만 유지)
+        existing.embedding_blob = embedding_to_blob(embedding)
+        existing.embedding_i8, existing.embedding_scale = quantize_embedding(embedding)
+        existing.embedding_norm = embedding_norm(embedding)
         existing.content = content
+        existing.content_hash = content_hash(content)
         existing.user_id = user_id
         existing.document_id = document_id
     else:
+        embedding_i8, embedding_scale = quantize_embedding(embedding)
         db.add(
             ClauseEmbedding(
                 id=uuid.uuid4(),
@@ -274,19 +380,114 @@ def upsert_clause_embedding(
                 user_id=user_id,
                 document_id=document_id,
                 embedding_model=EMBEDDING_MODEL,
-                embedding_json=json.dumps(embedding),
+                embedding_blob=embedding_to_blob(embedding),
+                embedding_i8=embedding_i8,
+                embedding_scale=embedding_scale,
+                embedding_norm=embedding_norm(embedding),
                 content=content,
+                content_hash=content_hash(content),
             )
         )
 
-    _upsert_qdrant_clause(
-        clause=clause,
-        analysis=analysis,
-        user_id=user_id,
-        document_id=document_id,
-        embedding=embedding,
-        content=content,
-    )
+
+def _is_unchanged(
+    existing: ClauseEmbedding,
+    content: str,
+    *,
+    user_id: uuid.UUID,
+    document_id: uuid.UUID,
+) -> bool:
+    if existing.embedding_model != EMBEDDING_MODEL or existing.embedding_blob is None:
+        return False
+    if existing.user_id != user_id or existing.document_id != document_id:
+        return False
+    if existing.content_hash is not None:
+        return existing.content_hash == content_hash(content)
+    # content_hash 컬럼 추가 이전 행은 원문 비교
+    return existing.content == content
+
+
+def upsert_clause_embedding(
+    db: Session,
+    *,
+    clause: Clause,
+    analysis: Optional[ClauseAnalysis],
+    user_id: uuid.UUID,
+    document_id: uuid.UUID,
+) -> None:
+    upsert_clause_embeddings(db, pairs=[(clause, analysis)], user_id=user_id, document_id=document_id)
+
+
+def upsert_clause_embeddings(
+    db: Session,
+    *,
+    pairs: list[tuple[Clause, Optional[ClauseAnalysis]]],
+    user_id: uuid.UUID,
+    document_id: uuid.UUID,
+) -> int:
+    """여러 조항을 한 번에 임베딩/저장. 기존 행 조회 1회 + 임베딩 배치 요청 + Qdrant 일괄 업로드. 새로 임베딩한 개수를 반환."""
+    items = []
+    for clause, analysis in pairs:
+        content = _build_embedding_text(clause, analysis)
+        if content:
+            items.append((clause, analysis, content))
+    if not items:
+        return 0
+
+    existing_by_clause = {
+        row.clause_id: row
+        for row in db.execute(
+            select(ClauseEmbedding).where(ClauseEmbedding.clause_id.in_([clause.id for clause, _, _ in items]))
+        ).scalars()
+    }
+    # 임베딩 입력이 그대로인 조항은 OpenAI 호출/DB 갱신/Qdrant upsert를 모두 생략
+    pending = [
+        (clause, analysis, content, existing_by_clause.get(clause.id))
+        for clause, analysis, content in items
+        if not (
+            clause.id in existing_by_clause
+            and _is_unchanged(existing_by_clause[clause.id], content, user_id=user_id, document_id=document_id)
+        )
+    ]
+    if not pending:
+        return 0
+
+    embeddings = create_query_embeddings([content for _, _, content, _ in pending])
+
+    qdrant_enabled = _get_qdrant_client() is not None
+    qdrant_ids: list[str] = []
+    qdrant_vectors: list[list[float]] = []
+    qdrant_payloads: list[dict] = []
+    count = 0
+    for (clause, analysis, content, existing), embedding in zip(pending, embeddings):
+        if not embedding:
+            logger.warning("임베딩 생성 실패 (clause_id=%s)", clause.id)
+            continue
+        _save_embedding_row(
+            db,
+            clause=clause,
+            user_id=user_id,
+            document_id=document_id,
+            content=content,
+            embedding=embedding,
+            existing=existing,
+        )
+        if qdrant_enabled:
+            qdrant_ids.append(str(clause.id))
+            qdrant_vectors.append(embedding)
+            qdrant_payloads.append(
+                _build_qdrant_payload(
+                    clause=clause,
+                    analysis=analysis,
+                    user_id=user_id,
+                    document_id=document_id,
+                    content=content,
+                )
+            )
+        count += 1
+
+    bulk_upsert_clauses(qdrant_ids, qdrant_vectors, qdrant_payloads)
+    return count
 
 
 def backfill_user_embeddings(
@@ -295,8 +496,6 @@ def backfill_user_embeddings(
     user_id: uuid.UUID,
     document_id: Optional[uuid.UUID] = None,
 ) -> int:
-    from sqlalchemy import outerjoin
-
     query = (
         db.query(Clause, ClauseAnalysis, Document)
         .join(ClauseAnalysis, ClauseAnalysis.clause_id == Clause.id)
@@ -309,17 +508,67 @@ def backfill_user_embeddings(
     if document_id:
         query = query.filter(Document.id == document_id)
 
-    rows = query.all()
+    qdrant_enabled = _get_qdrant_client() is not None
+    # 대량 backfill 동안은 HNSW 인덱싱을 멈췄다가 모든 청크를 올린 뒤 한 번에 빌드하게 한다
+    # (청크 단위 업로드 개수가 아니라 전체 대상 수로 판단. 컬렉션 설정만 바꾸므로 실패해도 데이터에는 영향 없음)
+    pause_indexing = qdrant_enabled and _is_remote_qdrant() and query.count() >= QDRANT_BULK_PAUSE_INDEXING_MIN
+    indexing_paused = False
     count = 0
-    for clause, analysis, doc in rows:
-        upsert_clause_embedding(
-            db=db,
-            clause=clause,
-            analysis=analysis,
-            user_id=user_id,
-            document_id=doc.id,
-        )
-        count += 1
+    last_clause_id = None
+    try:
+        # 전체를 한 번에 올리지 않고 clause.id 기준 keyset으로 BACKFILL_CHUNK_SIZE개씩 처리, 청크마다 커밋
+        while True:
+            chunk_query = query
+            if last_clause_id is not None:
+                chunk_query = chunk_query.filter(Clause.id > last_clause_id)
+            chunk = chunk_query.order_by(Clause.id).limit(BACKFILL_CHUNK_SIZE).all()
+            if not chunk:
+                break
+            last_clause_id = chunk[-1][0].id
+
+            contents = [_build_embedding_text(clause, analysis) for clause, analysis, _ in chunk]
+            embeddings = create_query_embeddings(contents)
+
+            qdrant_ids: list[str] = []
+            qdrant_vectors: list[list[float]] = []
+            qdrant_payloads: list[dict] = []
+            for (clause, analysis, doc), content, embedding in zip(chunk, contents, embeddings):
+                if not embedding:
+                    logger.warning("임베딩 생성 실패 (clause_id=%s)", clause.id)
+                    continue
+                # LEFT JOIN으로 임베딩 없는 조항만 골랐으므로 행별 존재 확인 없이 바로 추가
+                _save_embedding_row(
+                    db,
+                    clause=clause,
+                    user_id=user_id,
+                    document_id=doc.id,
+                    content=content,
+                    embedding=embedding,
+                )
+                if qdrant_enabled:
+                    qdrant_ids.append(str(clause.id))
+                    qdrant_vectors.append(embedding)
+                    qdrant_payloads.append(
+                        _build_qdrant_payload(
+                            clause=clause,
+                            analysis=analysis,
+                            user_id=user_id,
+                            document_id=doc.id,
+                            content=content,
+                        )
+                    )
+                count += 1
+
+            db.commit()
+            if pause_indexing and not indexing_paused and qdrant_ids:
+                # 벡터 차원을 알아야 컬렉션을 보장할 수 있으므로 첫 업로드 직전에 끈다
+                _ensure_qdrant_collection(len(qdrant_vectors[0]))
+                _set_indexing_threshold(_get_qdrant_client(), _get_qdrant_collection_name(), 0)
+                indexing_paused = True
+            bulk_upsert_clauses(qdrant_ids, qdrant_vectors, qdrant_payloads)
+    finally:
+        if indexing_paused:
+            _set_indexing_threshold(_get_qdrant_client(), _get_qdrant_collection_name(), QDRANT_INDEXING_THRESHOLD)
 
     logger.info("backfill 완료: user_id=%s, 새로 임베딩된 조항 %d개", user_id, count)
     return count
@@ -2,10 +2,9 @@
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from sqlalchemy.orm import Session
-from pathlib import Path
-import os
 import uuid
-import shutil
+
+import orjson
 
 from app.core.database import get_db
 from app.models.contract import Document, Clause, ClauseAnalysis, User
@@ -22,7 +21,7 @@ router = APIRouter(
 )
 
 @router.post("/analyze", response_model=DocumentResponse)
-async def analyze_labor_contract_endpoint(
+def analyze_labor_contract_endpoint(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -31,20 +30,13 @@ async def analyze_labor_contract_endpoint(
     [Legacy 호환용] 근로계약서 분석 엔드포인트
     프론트엔드 수정 없이 작동하도록 기존 URL 유지 + 내부 로직은 신규 통합 서비스(WORK 모드) 사용
     """
-    temp_dir = Path("temp_files")
-    temp_dir.mkdir(exist_ok=True)
-    temp_file_path = temp_dir / f"labor_{uuid.uuid4()}_{file.filename}"
-
     try:
-        # 1. 파일 임시 저장
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
+        # 1. 업로드 스트림을 그대로 분석 서비스에 전달 (임시 파일 저장 없음)
         # ★ [변경] 신규 통합 서비스 호출 (카테고리를 'WORK'로 고정)
         # 기존 law_advisor.analyze_work_contract() 대체
-        ai_result_json = analyze_contract(str(temp_file_path), "WORK")
+        ai_result_json = analyze_contract(file.file, "WORK", filename=file.filename)
 
-        # 2. DB 저장 (Document) - 기존 로직 유지
+        # 2. DB 저장 (Document) - PK는 클라이언트에서 생성하므로 중간 flush 없이 한 번에 INSERT
         new_doc = Document(
             id=uuid.uuid4(),
             filename=file.filename,
@@ -52,7 +44,6 @@ async def analyze_labor_contract_endpoint(
             status='done',
         )
         db.add(new_doc)
-        db.flush()
 
         # 3. Clause 저장
         new_clause = Clause(
@@ -63,12 +54,16 @@ async def analyze_labor_contract_endpoint(
             body="첨부된 계약서 원본 참조",
         )
         db.add(new_clause)
-        db.flush()
 
-        # 4. 위험도 체크
-        risk_level = 'LOW'
-        if '"risk_level": "HIGH"' in ai_result_json:
-            risk_level = 'HIGH'
+        # 4. 위험도 체크 (JSON 파싱 후 조항별 risk_level 확인)
+        try:
+            result_dict = orjson.loads(ai_result_json)
+            clauses_data = result_dict.get("clauses", []) if isinstance(result_dict, dict) else []
+        except orjson.JSONDecodeError:
+            clauses_data = []
+        risk_level = 'HIGH' if any(
+            isinstance(item, dict) and item.get("risk_level") == "HIGH" for item in clauses_data
+        ) else 'LOW'
 
         # 5. Analysis 저장
         new_analysis = ClauseAnalysis(
@@ -90,7 +85,6 @@ async def analyze_labor_contract_endpoint(
         )
 
         db.commit()
-        db.refresh(new_doc)
 
         return DocumentResponse(
             id=new_doc.id,
@@ -103,7 +97,3 @@ async def analyze_labor_contract_endpoint(
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"분석 실패: {str(e)}")
-    
-    finally:
-        if temp_file_path.exists():
-            os.remove(temp_file_path)
@@ -1,8 +1,15 @@
 # app/routers/auth.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import os
+import threading
+import time
+
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, make_transient_to_detached
 from jose import JWTError, jwt
 # import models  <-- [삭제됨] 이 줄이 에러의 원인이었습니다!
 from app.core.database import get_db
@@ -14,12 +21,70 @@ router = APIRouter(prefix="/api/auth", tags=["Auth"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 # --- [로그인한 사용자 확인 함수] ---
+# 토큰 → user.id 캐시 (JWT 디코드 + 이메일 조회 생략, 캐시 적중 시 PK 조회만 수행)
+_TOKEN_USER_CACHE: TTLCache = TTLCache(maxsize=4096, ttl=300)
+_TOKEN_USER_CACHE_LOCK = threading.Lock()
+
+# user.id → 세션에서 분리된(detached) User 스냅샷 (적중 시 merge(load=False)로 세션에 붙여 PK 조회도 생략)
+# User 행이 ORM으로 수정/삭제되면 아래 이벤트에서 즉시 비우고, 그 외에는 TTL로 만료
+_USER_CACHE: TTLCache = TTLCache(maxsize=4096, ttl=60)
+_USER_CACHE_LOCK = threading.Lock()
+
+# 로그인 시도 횟수 (클라이언트 IP별, 마지막 실패 후 60초 유지)
+# 이메일별로 세면 남의 계정을 잠글 수 있고, 429 여부로 가입된 이메일이 드러나므로 IP 기준으로 센다
+LOGIN_MAX_FAILURES = 5
+# 앞단 프록시(Railway 등) 개수. X-Forwarded-For의 오른쪽에서 이만큼째 값을 클라이언트 IP로 사용 (0이면 소켓 주소)
+# 클라이언트가 보낸 값은 왼쪽에 남으므로 위조해도 한도를 우회할 수 없다
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+_LOGIN_FAILURES: TTLCache = TTLCache(maxsize=10000, ttl=60)
+_LOGIN_FAILURES_LOCK = threading.Lock()
+
+
+def _cache_user(user: contract.User) -> None:
+    snapshot = contract.User(**{
+        attr.key: getattr(user, attr.key) for attr in sa_inspect(contract.User).column_attrs
+    })
+    make_transient_to_detached(snapshot)
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[user.id] = snapshot
+
+
+def _load_user(db: Session, user_id):
+    with _USER_CACHE_LOCK:
+        snapshot = _USER_CACHE.get(user_id)
+    if snapshot is not None:
+        return db.merge(snapshot, load=False)
+
+    user = db.get(contract.User, user_id)
+    if user is not None:
+        _cache_user(user)
+    return user
+
+
+@event.listens_for(contract.User, "after_update")
+@event.listens_for(contract.User, "after_delete")
+def _on_user_change(mapper, connection, target: contract.User) -> None:
+    with _USER_CACHE_LOCK:
+        _USER_CACHE.pop(target.id, None)
+
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="자격 증명이 유효하지 않습니다",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+    with _TOKEN_USER_CACHE_LOCK:
+        cached = _TOKEN_USER_CACHE.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        if expires_at is None or time.time() < expires_at:
+            user = _load_user(db, user_id)
+            if user is None:
+                raise credentials_exception
+            return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -31,6 +96,10 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(contract.User).filter(contract.User.email == email).first()
     if user is None:
         raise credentials_exception
+
+    with _TOKEN_USER_CACHE_LOCK:
+        _TOKEN_USER_CACHE[token] = (user.id, payload.get("exp"))
+    _cache_user(user)
     return user
 
 # --- [API 엔드포인트] ---
@@ -44,13 +113,43 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     hashed_password = get_password_hash(user.password)
     new_user = contract.User(email=user.email, hashed_password=hashed_password, name=user.name)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try:
+        db.commit()
+    except IntegrityError:
+        # 동시 가입 요청이 위 중복 확인을 모두 통과한 경우 (users.email UNIQUE 인덱스가 막아줌)
+        db.rollback()
+        raise HTTPException(status_code=400, detail="이미 등록된 이메일입니다.")
     
     return new_user
 
+def _client_ip(request: Request) -> str:
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db),
+):
+    # IP별 시도 횟수 제한 (bcrypt 검증 CPU를 무제한으로 소모하지 않도록)
+    # 검증 전에 락 안에서 먼저 1을 올려 두어, 동시에 보낸 요청들이 같은 값을 읽고 한도를 넘지 못하게 한다
+    client_ip = _client_ip(request)
+    with _LOGIN_FAILURES_LOCK:
+        attempts = _LOGIN_FAILURES.get(client_ip, 0)
+        if attempts < LOGIN_MAX_FAILURES:
+            _LOGIN_FAILURES[client_ip] = attempts + 1
+    if attempts >= LOGIN_MAX_FAILURES:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="로그인 시도가 너무 많습니다. 잠시 후 다시 시도해주세요.",
+        )
+
+    # 없는 이메일도 실패로 센 상태 그대로 둔다 (응답만으로는 가입 여부를 알 수 없음)
     user = db.query(contract.User).filter(contract.User.email == form_data.username).first()
     if not user or not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
@@ -58,7 +157,14 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             detail="이메일 또는 비밀번호가 틀렸습니다.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
+    # 성공한 시도는 실패 횟수에서 되돌린다
+    with _LOGIN_FAILURES_LOCK:
+        remaining = _LOGIN_FAILURES.get(client_ip, 0) - 1
+        if remaining > 0:
+            _LOGIN_FAILURES[client_ip] = remaining
+        else:
+            _LOGIN_FAILURES.pop(client_ip, None)
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
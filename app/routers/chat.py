@@ -1,94 +1,185 @@
 # app/routers/chat.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Optional
+import logging
 import uuid
 
-from app.core.database import get_db
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db, get_read_db
 from app.models import contract, schemas
 from app.routers.auth import get_current_user
-from app.services.chat_service import chat_with_context
+from app.services.chat_service import chat_with_context, stream_chat_with_context
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["Chat"])
 
 
-@router.post("", response_model=schemas.ChatResponse)
-def send_message(
-    req: schemas.ChatRequest,
-    db: Session = Depends(get_db),
-    current_user: contract.User = Depends(get_current_user),
-):
-    """사용자 메시지를 받아 계약서 컨텍스트 기반 AI 응답을 반환."""
+def _validate_request(req: schemas.ChatRequest, db: Session, user_id: uuid.UUID) -> None:
     if not req.message.strip():
         raise HTTPException(status_code=400, detail="메시지를 입력해주세요.")
 
     # document_id가 주어지면 소유권 검증
     if req.document_id:
         doc = (
-            db.query(contract.Document)
+            db.query(contract.Document.id)
             .filter(
                 contract.Document.id == req.document_id,
-                contract.Document.owner_id == current_user.id,
+                contract.Document.owner_id == user_id,
             )
             .first()
         )
         if not doc:
             raise HTTPException(status_code=404, detail="해당 문서를 찾을 수 없습니다.")
 
-    try:
-        top_k = req.top_k if req.top_k is not None else 6
-        min_similarity = req.min_similarity if req.min_similarity is not None else 0.35
-        use_rerank = req.use_rerank if req.use_rerank is not None else True
-
-        session, assistant_msg, citations = chat_with_context(
-            db=db,
-            user_id=current_user.id,
-            user_message=req.message.strip(),
-            session_id=req.session_id,
-            document_id=req.document_id,
-            top_k=max(1, min(top_k, 20)),
-            min_similarity=max(-1.0, min(min_similarity, 1.0)),
-            use_rerank=use_rerank,
-        )
 
-        return schemas.ChatResponse(
-            session_id=session.id,
-            message=schemas.ChatMessageResponse(
-                id=assistant_msg.id,
-                role=assistant_msg.role,
-                content=assistant_msg.content,
-                created_at=assistant_msg.created_at,
-            ),
-            citations=[
-                schemas.ChatCitation(
-                    clause_id=item.clause_id,
-                    document_id=item.document_id,
-                    document_filename=item.document_filename,
-                    clause_number=item.clause_number,
-                    clause_title=item.clause_title,
-                    risk_level=item.risk_level,
-                    score=item.score,
-                )
-                for item in citations
-            ],
-        )
+def _chat_kwargs(req: schemas.ChatRequest, user_id: uuid.UUID) -> dict:
+    top_k = req.top_k if req.top_k is not None else 6
+    min_similarity = req.min_similarity if req.min_similarity is not None else 0.35
+    use_rerank = req.use_rerank if req.use_rerank is not None else True
+    return dict(
+        user_id=user_id,
+        user_message=req.message.strip(),
+        session_id=req.session_id,
+        document_id=req.document_id,
+        top_k=max(1, min(top_k, 20)),
+        min_similarity=max(-1.0, min(min_similarity, 1.0)),
+        use_rerank=use_rerank,
+    )
+
+
+def _to_chat_response(session, assistant_msg, citations) -> schemas.ChatResponse:
+    return schemas.ChatResponse(
+        session_id=session.id,
+        message=schemas.ChatMessageResponse(
+            id=assistant_msg.id,
+            role=assistant_msg.role,
+            content=assistant_msg.content,
+            created_at=assistant_msg.created_at,
+        ),
+        citations=[
+            schemas.ChatCitation(
+                clause_id=item.clause_id,
+                document_id=item.document_id,
+                document_filename=item.document_filename,
+                clause_number=item.clause_number,
+                clause_title=item.clause_title,
+                risk_level=item.risk_level,
+                score=item.score,
+            )
+            for item in citations
+        ],
+    )
+
+
+def _sse(event: str, data: bytes) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+@router.post("", response_model=schemas.ChatResponse)
+def send_message(
+    req: schemas.ChatRequest,
+    db: Session = Depends(get_db),
+    current_user: contract.User = Depends(get_current_user),
+):
+    """사용자 메시지를 받아 계약서 컨텍스트 기반 AI 응답을 반환."""
+    _validate_request(req, db, current_user.id)
+
+    try:
+        session, assistant_msg, citations = chat_with_context(db=db, **_chat_kwargs(req, current_user.id))
+        return _to_chat_response(session, assistant_msg, citations)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"상담 처리 중 오류: {e}")
 
 
+@router.post("/stream")
+def send_message_stream(
+    req: schemas.ChatRequest,
+    db: Session = Depends(get_db),
+    current_user: contract.User = Depends(get_current_user),
+):
+    """
+    send_message의 SSE 스트리밍 버전 (첫 토큰부터 바로 전달).
+    - event: delta → {"content": 텍스트 조각}
+    - event: done  → ChatResponse (응답 저장/커밋 완료 후)
+    - event: error → {"detail": 오류 메시지}
+    """
+    _validate_request(req, db, current_user.id)
+    events = stream_chat_with_context(db=db, **_chat_kwargs(req, current_user.id))
+
+    def event_stream():
+        try:
+            for event, payload in events:
+                if event == "delta":
+                    yield _sse("delta", orjson.dumps({"content": payload}))
+                else:
+                    yield _sse("done", _to_chat_response(*payload).model_dump_json().encode())
+        except Exception as e:
+            db.rollback()
+            logger.exception("스트리밍 상담 처리 실패: %s", e)
+            yield _sse("error", orjson.dumps({"detail": f"상담 처리 중 오류: {e}"}))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/sessions", response_model=list[schemas.ChatSessionResponse])
 def list_sessions(
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[uuid.UUID] = Query(None, description="이전 페이지 마지막 세션 ID (그보다 오래된 세션부터 조회)"),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
     current_user: contract.User = Depends(get_current_user),
 ):
-    """사용자의 채팅 세션 목록 조회."""
+    """
+    사용자의 채팅 세션 목록 조회 (최신순).
+    (created_at, id) keyset 페이지네이션 - 다음 페이지가 있으면 X-Next-Cursor 헤더로 커서를 준다.
+    """
+    # 응답 스키마가 쓰는 컬럼만 조회 (ORM 객체/관계 프록시를 만들지 않음)
+    query = db.query(
+        contract.ChatSession.id,
+        contract.ChatSession.title,
+        contract.ChatSession.document_id,
+        contract.ChatSession.created_at,
+    ).filter(contract.ChatSession.user_id == current_user.id)
+
+    if cursor is not None:
+        cursor_created_at = (
+            db.query(contract.ChatSession.created_at)
+            .filter(
+                contract.ChatSession.id == cursor,
+                contract.ChatSession.user_id == current_user.id,
+            )
+            .scalar()
+        )
+        if cursor_created_at is None:
+            raise HTTPException(status_code=400, detail="유효하지 않은 커서입니다.")
+        query = query.filter(
+            or_(
+                contract.ChatSession.created_at < cursor_created_at,
+                and_(
+                    contract.ChatSession.created_at == cursor_created_at,
+                    contract.ChatSession.id < cursor,
+                ),
+            )
+        )
+
     sessions = (
-        db.query(contract.ChatSession)
-        .filter(contract.ChatSession.user_id == current_user.id)
-        .order_by(contract.ChatSession.created_at.desc())
-        .limit(20)
+        query.order_by(contract.ChatSession.created_at.desc(), contract.ChatSession.id.desc())
+        .limit(limit + 1)
         .all()
     )
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        response.headers["X-Next-Cursor"] = str(sessions[-1].id)
     return sessions
 
 
@@ -98,12 +189,18 @@ def list_sessions(
 )
 def get_session_messages(
     session_id: uuid.UUID,
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[uuid.UUID] = Query(None, description="이전 페이지 마지막 메시지 ID (이후 메시지부터 조회)"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="생략 시 전체 조회"),
+    db: Session = Depends(get_read_db),
     current_user: contract.User = Depends(get_current_user),
 ):
-    """특정 세션의 전체 메시지 조회."""
+    """
+    특정 세션의 메시지 조회 (시간순).
+    limit을 주면 (created_at, id) keyset 페이지네이션으로 나눠 받고, 다음 페이지가 있으면 X-Next-Cursor 헤더로 커서를 준다.
+    """
     session = (
-        db.query(contract.ChatSession)
+        db.query(contract.ChatSession.id)
         .filter(
             contract.ChatSession.id == session_id,
             contract.ChatSession.user_id == current_user.id,
@@ -113,10 +210,40 @@ def get_session_messages(
     if not session:
         raise HTTPException(status_code=404, detail="세션을 찾을 수 없습니다.")
 
-    messages = (
-        db.query(contract.ChatMessage)
-        .filter(contract.ChatMessage.session_id == session_id)
-        .order_by(contract.ChatMessage.created_at.asc())
-        .all()
-    )
+    query = db.query(
+        contract.ChatMessage.id,
+        contract.ChatMessage.role,
+        contract.ChatMessage.content,
+        contract.ChatMessage.created_at,
+    ).filter(contract.ChatMessage.session_id == session_id)
+
+    if cursor is not None:
+        cursor_created_at = (
+            db.query(contract.ChatMessage.created_at)
+            .filter(
+                contract.ChatMessage.id == cursor,
+                contract.ChatMessage.session_id == session_id,
+            )
+            .scalar()
+        )
+        if cursor_created_at is None:
+            raise HTTPException(status_code=400, detail="유효하지 않은 커서입니다.")
+        query = query.filter(
+            or_(
+                contract.ChatMessage.created_at > cursor_created_at,
+                and_(
+                    contract.ChatMessage.created_at == cursor_created_at,
+                    contract.ChatMessage.id > cursor,
+                ),
+            )
+        )
+
+    query = query.order_by(contract.ChatMessage.created_at.asc(), contract.ChatMessage.id.asc())
+    if limit is None:
+        return query.all()
+
+    messages = query.limit(limit + 1).all()
+    if len(messages) > limit:
+        messages = messages[:limit]
+        response.headers["X-Next-Cursor"] = str(messages[-1].id)
     return messages
@@ -3,10 +3,10 @@ from typing import Dict, List, Optional
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.contract import User, ContactInquiry
 from app.routers.auth import get_current_user
 
@@ -32,8 +32,7 @@ class ContactResponse(BaseModel):
     status: str
     created_at: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 CONTACT_CATEGORY_LABELS: Dict[str, str] = {
@@ -81,7 +80,7 @@ def submit_contact(
 @router.get("/admin", response_model=List[ContactResponse])
 def list_inquiries(
     status: Optional[str] = Query(None, description="pending / replied / closed"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: User = Depends(get_admin_user),
 ):
     query = db.query(ContactInquiry).order_by(ContactInquiry.created_at.desc())
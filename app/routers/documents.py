@@ -1,4 +1,7 @@
+import logging
+
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.routers.auth import get_current_user
@@ -12,8 +15,11 @@ from app.models.contract import (
     Notification,
     User,
 )
+from app.services import semantic_cache
 import uuid
 
+logger = logging.getLogger(__name__)
+
 # ★ 프론트엔드 요청 주소(/api/analyze)에 맞춤
 router = APIRouter(
     prefix="/api/analyze", 
@@ -21,8 +27,8 @@ router = APIRouter(
 )
 
 @router.delete("/{document_id}")
-async def delete_document(
-    document_id: str,
+def delete_document(
+    document_id: uuid.UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -31,15 +37,9 @@ async def delete_document(
     (본인이 올린 문서만 삭제 가능)
     """
     try:
-        # UUID 형변환 시도 (유효하지 않은 ID가 올 경우 방어)
-        try:
-            target_uuid = uuid.UUID(document_id)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="유효하지 않은 문서 ID입니다.")
-
         # 1. 문서 찾기 (내 문서인지 확인)
-        document = db.query(Document).filter(
-            Document.id == target_uuid,
+        document = db.query(Document.id).filter(
+            Document.id == document_id,
             Document.owner_id == current_user.id
         ).first()
 
@@ -49,32 +49,28 @@ async def delete_document(
                 detail="문서를 찾을 수 없거나 삭제 권한이 없습니다."
             )
 
-        # 2. 연관된 데이터 삭제 (Cascade 미설정/DB FK 제약 대비 수동 삭제)
-        # (0) 알림/임베딩/채팅 세션 등 문서 직접 참조 데이터부터 정리
-        db.query(Notification).filter(Notification.document_id == target_uuid).delete()
-        db.query(ClauseEmbedding).filter(ClauseEmbedding.document_id == target_uuid).delete()
-
-        # 채팅 세션 삭제 전 메시지를 먼저 삭제 (FK 제약 대응)
-        sessions = db.query(ChatSession).filter(ChatSession.document_id == target_uuid).all()
-        session_ids = [s.id for s in sessions]
-        if session_ids:
-            for session_id in session_ids:
-                db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-            db.query(ChatSession).filter(ChatSession.document_id == target_uuid).delete()
+        # 2. 연관된 데이터 삭제
+        #    MySQL 스키마는 ON DELETE CASCADE가 걸려 있지만, SQLite(FK 미적용)와 업그레이드 전 스키마를 위해 명시적으로 삭제
+        #    조항/세션별 루프 없이 IN (SELECT ...) 서브쿼리로 테이블당 DELETE 1회
+        clause_ids = select(Clause.id).where(Clause.document_id == document_id)
+        session_ids = select(ChatSession.id).where(ChatSession.document_id == document_id)
+        statements = [
+            # (0) 알림/임베딩/채팅 등 문서 직접 참조 데이터부터 정리 (메시지 → 세션 순서, FK 제약 대응)
+            delete(Notification).where(Notification.document_id == document_id),
+            delete(ClauseEmbedding).where(ClauseEmbedding.document_id == document_id),
+            delete(ChatMessage).where(ChatMessage.session_id.in_(session_ids)),
+            delete(ChatSession).where(ChatSession.document_id == document_id),
+            # (1) 조항별 분석(Analysis) → (2) 조항 → (3) 문서 본체
+            delete(ClauseAnalysis).where(ClauseAnalysis.clause_id.in_(clause_ids)),
+            delete(Clause).where(Clause.document_id == document_id),
+            delete(Document).where(Document.id == document_id),
+        ]
+        for stmt in statements:
+            db.execute(stmt.execution_options(synchronize_session=False))
 
-        # (1) 해당 문서의 조항들(Clauses) 찾기
-        clauses = db.query(Clause).filter(Clause.document_id == target_uuid).all()
-        for clause in clauses:
-            # (2) 조항별 분석(Analysis) 삭제
-            db.query(ClauseAnalysis).filter(ClauseAnalysis.clause_id == clause.id).delete()
-        
-        # (3) 조항 삭제
-        db.query(Clause).filter(Clause.document_id == target_uuid).delete()
-        
-        # (4) 문서(Document) 본체 삭제
-        db.delete(document)
-        
         db.commit()
+        # 일괄 DELETE는 ORM 이벤트를 발생시키지 않으므로 채팅 응답 캐시를 직접 비운다
+        semantic_cache.invalidate_user(current_user.id)
 
         return {"status": "success", "message": "문서가 성공적으로 삭제되었습니다."}
 
@@ -82,5 +78,5 @@ async def delete_document(
         raise he
     except Exception as e:
         db.rollback()
-        print(f"[ERROR] 문서 삭제 실패: {e}")
+        logger.exception("문서 삭제 실패: %s", e)
         raise HTTPException(status_code=500, detail=f"문서 삭제 중 오류가 발생했습니다: {e}")
@@ -2,82 +2,84 @@
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from sqlalchemy.orm import Session
-from pathlib import Path
-import os
-import uuid
-import shutil
-import json
+import logging
 from urllib.parse import unquote
 
+import orjson
+
 from app.core.database import get_db
-from app.models.contract import Document, Clause, ClauseAnalysis, User
+from app.models.contract import User
 from app.models.schemas import DocumentResponse
 from app.routers.auth import get_current_user
-from app.services.notification_service import create_analysis_done_notification
+from app.services.report_service import save_analysis_report
 
 # 만능 서비스 함수 임포트
 from app.services.ai_advisor import analyze_contract
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/api/general",
     tags=["General Contract Analysis"],
 )
 
+# 카테고리별 리포트 (제목, 요약 문구)
+CATEGORY_REPORT_META = {
+    "WORK": ("일터(Work) 법률 자문 리포트", "근로기준법 및 하도급법 기반 정밀 분석"),
+    "CONSUMER": ("소비자(Consumer) 권익 보호 리포트", "소비자분쟁해결기준 및 방문판매법 기반 분석"),
+    "NDA": ("지식재산(IP) & 커리어 보호 리포트", "부정경쟁방지법 및 영업비밀 보호 판례 기반 분석"),
+    "GENERAL": ("일반 법률 문서 분석 리포트", "민법(신의성실의 원칙) 및 약관규제법 기반 분석"),
+}
+DEFAULT_REPORT_META = ("법률 자문 리포트", "AI 법률 자문 결과")
+
+
 # --- [1] 일터(Work) 계약 분석 ---
 @router.post("/work", response_model=DocumentResponse)
-async def analyze_work_contract(
+def analyze_work_contract(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """근로계약서, 프리랜서 용역 계약서 분석"""
-    return await _process_analysis(file, db, current_user, "WORK")
+    return _process_analysis(file, db, current_user, "WORK")
 
 # --- [2] 소비자(Consumer) 계약 분석 ---
 @router.post("/consumer", response_model=DocumentResponse)
-async def analyze_consumer_contract(
+def analyze_consumer_contract(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """헬스장, 예식장, 필라테스 등 소비자 서비스 계약 분석"""
-    return await _process_analysis(file, db, current_user, "CONSUMER")
+    return _process_analysis(file, db, current_user, "CONSUMER")
 
 # --- [3] 비밀유지서약서(NDA) 분석 ---
 @router.post("/nda", response_model=DocumentResponse)
-async def analyze_nda_contract(
+def analyze_nda_contract(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """비밀유지서약서(NDA), 전직금지 약정 분석"""
-    return await _process_analysis(file, db, current_user, "NDA")
+    return _process_analysis(file, db, current_user, "NDA")
 
 # --- [4] 기타(General) 계약 분석 ---
 @router.post("/other", response_model=DocumentResponse)
-async def analyze_other_contract(
+def analyze_other_contract(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """분류되지 않은 기타 계약서(동업계약서, 차용증, 각서 등) 분석"""
-    return await _process_analysis(file, db, current_user, "GENERAL")
+    return _process_analysis(file, db, current_user, "GENERAL")
 
 
 # --- [내부 공통 함수] ---
-async def _process_analysis(file: UploadFile, db: Session, user: User, category: str):
-    temp_dir = Path("temp_files")
-    temp_dir.mkdir(exist_ok=True)
-    temp_file_path = temp_dir / f"{category}_{uuid.uuid4()}_{file.filename}"
-
+def _process_analysis(file: UploadFile, db: Session, user: User, category: str):
     try:
-        # 1. 파일 임시 저장
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # 2. AI 분석 요청
-        ai_result_json = analyze_contract(str(temp_file_path), category)
-        print(f"[DEBUG] AI 분석 결과 (앞 500자): {ai_result_json[:500]}")
+        # 1~2. AI 분석 요청 (업로드 스트림을 그대로 전달, 임시 파일 저장 없음)
+        ai_result_json = analyze_contract(file.file, category, filename=file.filename)
+        logger.debug("AI 분석 결과 (앞 500자): %s", ai_result_json[:500])
 
         # 변수 초기화
         report_title = ""
@@ -88,12 +90,12 @@ async def _process_analysis(file: UploadFile, db: Session, user: User, category:
         
         # JSON 파싱
         try:
-            result_dict = json.loads(ai_result_json)
+            result_dict = orjson.loads(ai_result_json)
             summary_data = result_dict.get("summary", {})
             contract_type = summary_data.get("contract_type_detected", "")
             clauses_data = result_dict.get("clauses", [])
             overall_comment = summary_data.get("overall_comment", "")
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             # AI 응답이 깨졌을 경우의 방어 로직 (이 경우만 에러 처리)
             raise HTTPException(status_code=502, detail="AI 분석 결과를 처리할 수 없습니다.")
 
@@ -116,130 +118,41 @@ async def _process_analysis(file: UploadFile, db: Session, user: User, category:
 
         else:
             # [정상 케이스] 카테고리별 제목 설정
-            if category == "WORK":
-                report_title = "일터(Work) 법률 자문 리포트"
-                summary_text = "근로기준법 및 하도급법 기반 정밀 분석"
-            elif category == "CONSUMER":
-                report_title = "소비자(Consumer) 권익 보호 리포트"
-                summary_text = "소비자분쟁해결기준 및 방문판매법 기반 분석"
-            elif category == "NDA":
-                report_title = "지식재산(IP) & 커리어 보호 리포트"
-                summary_text = "부정경쟁방지법 및 영업비밀 보호 판례 기반 분석"
-            elif category == "GENERAL":
-                report_title = "일반 법률 문서 분석 리포트"
-                summary_text = "민법(신의성실의 원칙) 및 약관규제법 기반 분석"
-            else:
-                report_title = "법률 자문 리포트"
-                summary_text = "AI 법률 자문 결과"
-
-        # 3. DB 저장 (Document)
-        # 계약서가 아니더라도 'done' 상태로 저장하여 결과 화면을 보여줌
-        safe_filename = unquote(file.filename or 'unknown.pdf')
-        
-        new_doc = Document(
-            id=uuid.uuid4(),
-            filename=safe_filename,
+            report_title, summary_text = CATEGORY_REPORT_META.get(category, DEFAULT_REPORT_META)
+
+        # 3. DB 저장 (문서 + 종합 요약 + 개별 조항 + 알림)
+        new_doc, risk_count = save_analysis_report(
+            db,
             owner_id=user.id,
-            status='done', 
-        )
-        db.add(new_doc)
-        db.flush()
-
-        # 4. 종합 요약 조항 저장 (필수)
-        summary_clause = Clause(
-            id=uuid.uuid4(),
-            document_id=new_doc.id,
-            clause_number="종합 분석 결과",
-            title=report_title,
-            body="첨부된 파일 분석 결과" if is_valid_contract else "분석이 거절되었습니다.",
-        )
-        db.add(summary_clause)
-        db.flush()
-
-        # 위험도 점수 설정
-        if not is_valid_contract:
-            # 계약서가 아니면 점수는 0점 처리하되, 위험도는 LOW로 표시 (또는 UI에서 처리)
-            summary_risk = 0
-            summary_risk_level = 'LOW' # 빨간색보다는 회색/초록색으로 뜨게
-        else:
-            summary_risk = summary_data.get("total_score", 0)
-            summary_risk_level = 'HIGH' if summary_risk == 0 or summary_data.get("risk_count", 0) > 0 else 'LOW'
-
-        summary_analysis = ClauseAnalysis(
-            id=uuid.uuid4(),
-            clause_id=summary_clause.id,
-            risk_level=summary_risk_level,
-            summary=summary_text,
-            suggestion=overall_comment, # 여기에 "계약서가 아닙니다" 내용이 들어감
+            filename=unquote(file.filename or 'unknown.pdf'),
+            summary_clause_number="종합 분석 결과",
+            summary_body="첨부된 파일 분석 결과",
+            report_title=report_title,
+            summary_text=summary_text,
+            is_valid_contract=is_valid_contract,
+            summary_data=summary_data,
+            overall_comment=overall_comment,
+            clauses_data=clauses_data,
         )
-        db.add(summary_analysis)
-        db.flush()
-
-        # 5. 개별 조항 저장 (정상 계약서일 때만 실행됨)
-        risk_count = 0
-        for item in clauses_data:
-            if not isinstance(item, dict):
-                continue
-
-            clause_risk = item.get("risk_level", "LOW")
-            if clause_risk == "HIGH":
-                risk_count += 1
-
-            new_clause = Clause(
-                id=uuid.uuid4(),
-                document_id=new_doc.id,
-                clause_number=item.get("article_number", item.get("clause_number", "미분류")),
-                title=item.get("title", "제목 없음"),
-                body=item.get("original_text", item.get("body", "")),
-            )
-            db.add(new_clause)
-            db.flush()
-
-            tags_data = []
-            legal_basis = item.get("legal_basis", "")
-            if legal_basis:
-                tags_data.append({"legal_basis": legal_basis})
-
-            new_analysis = ClauseAnalysis(
-                id=uuid.uuid4(),
-                clause_id=new_clause.id,
-                risk_level=clause_risk,
-                summary=item.get("analysis", item.get("summary", "")),
-                suggestion=item.get("suggestion", ""),
-                tags=tags_data,
-            )
-            db.add(new_analysis)
-            db.flush()
-
-        # 알림 생성
-        create_analysis_done_notification(
-            db=db,
-            user_id=user.id,
-            document_id=new_doc.id,
-            filename=new_doc.filename,
-            risk_count=risk_count,
-        )
-
-        db.commit()
-        db.refresh(new_doc)
 
-        # ★ [성공 반환] 200 OK와 함께 문서 정보 반환
-        return DocumentResponse(
+        # flush 시점에 id/created_at 이 이미 채워져 있으므로 커밋 전에 응답을 만들어
+        # 커밋 후 만료된 속성을 다시 읽는 SELECT(refresh)를 생략
+        response = DocumentResponse(
             id=new_doc.id,
             filename=new_doc.filename,
             status=new_doc.status,
             created_at=new_doc.created_at,
             risk_count=risk_count,
         )
+        db.commit()
+
+        # ★ [성공 반환] 200 OK와 함께 문서 정보 반환
+        return response
 
     except HTTPException as he:
         db.rollback()
         raise he
     except Exception as e:
         db.rollback()
-        print(f"[ERROR] {category} 분석 중 예외 발생: {str(e)}")
+        logger.exception("%s 분석 중 예외 발생: %s", category, e)
         raise HTTPException(status_code=500, detail=f"서버 내부 오류: {str(e)}")
-    
-    finally:
-        if temp_file_path.exists():
-            os.remove(temp_file_path)
\ No newline at end of file
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.contract import Notification, NotificationSetting, User
 from app.models.schemas import NotificationResponse
 from app.routers.auth import get_current_user
@@ -39,7 +39,7 @@ def _get_or_create_settings(db: Session, user_id):
 
 @router.get("", response_model=List[NotificationResponse])
 def list_notifications(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     notifications = (
@@ -88,7 +88,7 @@ def update_notification_settings(
 
 @router.get("/unread", response_model=List[NotificationResponse])
 def list_unread_notifications(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     notifications = (
@@ -110,20 +110,17 @@ def mark_notification_as_read(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    notification = (
+    # SELECT 후 수정하지 않고 조건부 UPDATE 1회 (일치 행 수로 존재/소유 여부 확인, 커밋은 get_db에서)
+    updated = (
         db.query(Notification)
         .filter(
             Notification.id == notification_id,
             Notification.user_id == current_user.id,
         )
-        .first()
+        .update({"is_read": True}, synchronize_session=False)
     )
-    if not notification:
+    if not updated:
         raise HTTPException(status_code=404, detail="알림을 찾을 수 없습니다.")
-
-    notification.is_read = True
-    db.add(notification)
-    db.flush()
     return {"ok": True}
 
 
@@ -140,5 +137,4 @@ def mark_all_notifications_as_read(
         )
         .update({"is_read": True}, synchronize_session=False)
     )
-    db.flush()
     return {"ok": True}
@@ -1,80 +1,123 @@
-﻿from typing import List, Optional
+﻿from typing import BinaryIO, List, Optional
+import logging
+import os
+import shutil
+import tempfile
 import uuid
 from urllib.parse import unquote
 
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models import contract, schemas
-from app.rag.vectorstore import backfill_user_embeddings, upsert_clause_embedding
+from app.rag.vectorstore import backfill_user_embeddings
 from app.routers.auth import get_current_user
-from app.services.analyzer import analyze_contract
-from app.services.notification_service import create_analysis_done_notification
+from app.services.analysis_batch import cancel_analysis_batch, submit_analysis_batch
+from app.services.analyzer import MAX_TEXT_CHARS, VISION_MAX_PAGES, analyze_contract
 from app.services.pdf_parser import extract_content_from_pdf
+from app.services.report_service import save_clause_results
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix='/api/analyze', tags=['Analyze'])
 
 
+def _copy_upload(src: BinaryIO, dst: BinaryIO) -> None:
+    """업로드 파일을 임시 파일로 복사. 디스크로 넘어간 업로드는 sendfile로 커널 안에서 복사한다."""
+    # 메모리에 있는(작은) SpooledTemporaryFile에 fileno()를 부르면 디스크로 rollover 되므로 제외
+    if getattr(src, '_rolled', False) and hasattr(os, 'sendfile'):
+        try:
+            in_fd, out_fd = src.fileno(), dst.fileno()
+            size = os.fstat(in_fd).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except OSError:
+            # sendfile 미지원 파일시스템 등 → 처음부터 일반 복사
+            dst.seek(0)
+            dst.truncate()
+
+    src.seek(0)
+    shutil.copyfileobj(src, dst, length=1 << 20)  # 1MiB 단위 스트리밍 복사
+
+
+def _parse_upload(file: UploadFile) -> dict:
+    temp_file_path = None
+    try:
+        # 업로드를 메모리에 통째로 올리지 않고 1MiB 단위로 임시 파일에 복사한 뒤,
+        # 파싱 워커 프로세스가 경로로 직접 열게 한다 (요청 스레드는 PDF 바이트를 들고 있지 않음)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as buffer:
+            temp_file_path = buffer.name
+            _copy_upload(file.file, buffer)
+        logger.debug("업로드 파일 저장 완료: %s (%s bytes)", file.filename, file.size)
+
+        parsed_data = extract_content_from_pdf(
+            temp_file_path, max_image_pages=VISION_MAX_PAGES, max_text_chars=MAX_TEXT_CHARS
+        )
+        logger.debug("PDF 추출 타입: %s", parsed_data['type'])
+        return parsed_data
+    finally:
+        if temp_file_path and os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+
 @router.get('', response_model=List[schemas.DocumentResponse])
 def list_documents(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: contract.User = Depends(get_current_user),
 ):
-    docs = (
-        db.query(contract.Document)
+    # 문서별 위험 조항 수를 SQL에서 집계 (문서/조항/분석을 지연 로딩으로 훑던 1 + N + N×M 쿼리 → 1회)
+    # COUNT는 NULL을 세지 않으므로 HIGH가 아닌 행은 CASE에서 NULL로 떨어진다 (MySQL에는 FILTER 절이 없음)
+    risk_count = func.count(case((contract.ClauseAnalysis.risk_level == 'HIGH', 1)))
+    rows = (
+        db.query(
+            contract.Document.id,
+            contract.Document.filename,
+            contract.Document.status,
+            contract.Document.created_at,
+            risk_count.label('risk_count'),
+        )
+        .outerjoin(contract.Clause, contract.Clause.document_id == contract.Document.id)
+        .outerjoin(contract.ClauseAnalysis, contract.ClauseAnalysis.clause_id == contract.Clause.id)
         .filter(contract.Document.owner_id == current_user.id)
+        .group_by(contract.Document.id)
         .order_by(contract.Document.created_at.desc())
         .all()
     )
 
-    results: List[schemas.DocumentResponse] = []
-    for doc in docs:
-        risk_count = 0
-        for clause in doc.clauses:
-            if clause.analysis and clause.analysis.risk_level == 'HIGH':
-                risk_count += 1
-
-        results.append(
-            schemas.DocumentResponse(
-                id=doc.id,
-                filename=doc.filename,
-                status=doc.status,
-                created_at=doc.created_at,
-                risk_count=risk_count,
-            )
+    # DB에서 읽은 값이라 타입이 이미 맞으므로 행마다 Pydantic 검증을 돌리지 않고 바로 조립
+    return [
+        schemas.DocumentResponse.model_construct(
+            id=row.id,
+            filename=row.filename,
+            status=row.status,
+            created_at=row.created_at,
+            risk_count=row.risk_count,
         )
-
-    return results
+        for row in rows
+    ]
 
 
 @router.post('', response_model=schemas.DocumentResponse)
-async def analyze_document(
+def analyze_document(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: contract.User = Depends(get_current_user),
 ):
     try:
-        content_bytes = await file.read()
-        print(f"\n[DEBUG 1] 파일 읽기 완료: {file.filename} ({len(content_bytes)} bytes)")
-
-        parsed_data = extract_content_from_pdf(content_bytes)
-        print(f"[DEBUG 2] PDF 추출 타입: {parsed_data['type']}")
+        parsed_data = _parse_upload(file)
 
         ai_result = analyze_contract(parsed_data)
-        print(f"[DEBUG 3] AI 분석 결과 수신: {ai_result}")
+        logger.debug("AI 분석 결과 수신: %s", ai_result)
 
         safe_filename = unquote(file.filename or 'unknown.pdf')
 
-        new_doc = contract.Document(
-            id=uuid.uuid4(),
-            filename=safe_filename,
-            owner_id=current_user.id,
-            status='done',
-        )
-        db.add(new_doc)
-        db.flush()
-
         clauses_data = ai_result.get('clauses', [])
         if not isinstance(clauses_data, list) or len(clauses_data) == 0:
             raise HTTPException(
@@ -82,52 +125,18 @@ async def analyze_document(
                 detail='AI 분석 결과가 비어 있습니다. API 키/모델 응답/PDF 추출 내용을 확인하세요.',
             )
 
-        risk_count = 0
-        for item in clauses_data:
-            if not isinstance(item, dict):
-                continue
-
-            new_clause = contract.Clause(
-                id=uuid.uuid4(),
-                document_id=new_doc.id,
-                clause_number=item.get('clause_number', '미분류'),
-                title=item.get('title', '제목 없음'),
-                body=item.get('body', ''),
-            )
-            db.add(new_clause)
-            db.flush()
-
-            risk_level = item.get('risk_level', 'LOW')
-            if risk_level == 'HIGH':
-                risk_count += 1
-
-            new_analysis = contract.ClauseAnalysis(
-                id=uuid.uuid4(),
-                clause_id=new_clause.id,
-                risk_level=risk_level,
-                summary=item.get('summary', ''),
-                suggestion=item.get('suggestion', ''),
-            )
-            db.add(new_analysis)
-            db.flush()
-
-            upsert_clause_embedding(
-                db=db,
-                clause=new_clause,
-                analysis=new_analysis,
-                user_id=current_user.id,
-                document_id=new_doc.id,
-            )
-
-        create_analysis_done_notification(
-            db=db,
-            user_id=current_user.id,
-            document_id=new_doc.id,
-            filename=new_doc.filename,
-            risk_count=risk_count,
+        new_doc = contract.Document(
+            id=uuid.uuid4(),
+            filename=safe_filename,
+            owner_id=current_user.id,
+            status='done',
         )
+        db.add(new_doc)
+        db.flush()  # 아래 일괄 INSERT가 참조할 문서 행을 먼저 기록 (문서당 1회)
 
-        db.refresh(new_doc)
+        risk_count = save_clause_results(db, document=new_doc, clauses_data=clauses_data)
+
+        # risk_count는 INSERT 루프에서 이미 셌고, id/created_at 은 flush 때 채워졌으므로 refresh(SELECT) 불필요
         return schemas.DocumentResponse(
             id=new_doc.id,
             filename=new_doc.filename,
@@ -141,46 +150,115 @@ async def analyze_document(
         raise HTTPException(status_code=500, detail=f'분석 처리 중 오류: {e}') from e
 
 
-@router.get('/{document_id}/result')
+@router.post('/batch', response_model=schemas.DocumentResponse)
+def analyze_document_batch(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: contract.User = Depends(get_current_user),
+):
+    """
+    결과를 바로 기다리지 않는 분석 요청 (OpenAI Batch API, 최대 24시간).
+    문서는 status='pending'으로 저장되고, 결과가 오면 조항/분석이 채워지며 완료 알림이 생성된다.
+    """
+    try:
+        parsed_data = _parse_upload(file)
+
+        # 문서를 먼저 커밋한 뒤 batch를 만든다 (batch만 생성되고 문서 저장이 실패하면 아무도 폴링하지 않는 batch가 남음)
+        # openai_batch_id가 채워지기 전까지는 폴러가 이 문서를 건너뛴다
+        new_doc = contract.Document(
+            id=uuid.uuid4(),
+            filename=unquote(file.filename or 'unknown.pdf'),
+            owner_id=current_user.id,
+            status='pending',
+        )
+        db.add(new_doc)
+        db.commit()
+
+        batch_id = None
+        try:
+            batch_id = submit_analysis_batch(parsed_data, new_doc.id)
+            new_doc.openai_batch_id = batch_id
+            db.commit()
+        except Exception:
+            db.rollback()
+            if batch_id is not None:
+                cancel_analysis_batch(batch_id)
+            new_doc.status = 'failed'
+            db.commit()
+            raise
+
+        return schemas.DocumentResponse(
+            id=new_doc.id,
+            filename=new_doc.filename,
+            status=new_doc.status,
+            created_at=new_doc.created_at,
+            risk_count=0,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'분석 요청 중 오류: {e}') from e
+
+
+@router.get('/{document_id}/result', response_model=schemas.AnalysisDetailResponse)
 def get_analysis_detail(
     document_id: uuid.UUID,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: contract.User = Depends(get_current_user),
 ):
-    doc = (
-        db.query(contract.Document)
+    filename = (
+        db.query(contract.Document.filename)
         .filter(
             contract.Document.id == document_id,
             contract.Document.owner_id == current_user.id,
         )
-        .first()
+        .scalar()
     )
-    if not doc:
+    if filename is None:
         raise HTTPException(status_code=404, detail='문서를 찾을 수 없습니다.')
 
+    # 조항 + 분석을 JOIN 1회로 조회 (doc.clauses / clause.analysis 지연 로딩으로 조항마다 SELECT 하지 않음)
+    rows = (
+        db.query(
+            contract.Clause.clause_number,
+            contract.Clause.title,
+            contract.Clause.body,
+            contract.ClauseAnalysis.id.label('analysis_id'),
+            contract.ClauseAnalysis.risk_level,
+            contract.ClauseAnalysis.summary,
+            contract.ClauseAnalysis.suggestion,
+            contract.ClauseAnalysis.tags,
+        )
+        .outerjoin(contract.ClauseAnalysis, contract.ClauseAnalysis.clause_id == contract.Clause.id)
+        .filter(contract.Clause.document_id == document_id)
+        .all()
+    )
+
     results = []
-    for clause in doc.clauses:
+    for row in rows:
+        has_analysis = row.analysis_id is not None
+
         # tags에서 legal_basis 추출
         legal_basis = ''
-        if clause.analysis and clause.analysis.tags:
-            for tag in clause.analysis.tags:
+        if has_analysis and row.tags:
+            for tag in row.tags:
                 if isinstance(tag, dict) and 'legal_basis' in tag:
                     legal_basis = tag['legal_basis']
                     break
 
         results.append(
-            {
-                'clause_number': clause.clause_number,
-                'title': clause.title,
-                'original_text': clause.body or '',
-                'risk_level': clause.analysis.risk_level if clause.analysis else 'UNKNOWN',
-                'summary': clause.analysis.summary if clause.analysis else '',
-                'suggestion': clause.analysis.suggestion if clause.analysis else '',
-                'legal_basis': legal_basis,
-            }
+            schemas.AnalysisClauseResponse.model_construct(
+                clause_number=row.clause_number,
+                title=row.title,
+                original_text=row.body or '',
+                risk_level=row.risk_level if has_analysis else 'UNKNOWN',
+                summary=row.summary if has_analysis else '',
+                suggestion=row.suggestion if has_analysis else '',
+                legal_basis=legal_basis,
+            )
         )
 
-    return {'filename': doc.filename, 'analysis': results}
+    # response_model이 있으면 FastAPI가 jsonable_encoder + json.dumps 대신 Pydantic으로 바로 JSON 바이트를 만든다
+    # (조항 목록은 DB 값으로 만든 것이라 model_construct로 검증을 건너뜀 - 응답 직렬화 시 한 번만 처리)
+    return schemas.AnalysisDetailResponse.model_construct(filename=filename, analysis=results)
 
 
 @router.post('/backfill-embeddings')
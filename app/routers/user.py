@@ -5,10 +5,13 @@ from app.models import contract, schemas
 from app.core.security import verify_password, get_password_hash
 from app.routers.auth import get_current_user  # 기존 인증 로직 재사용
 from fastapi import Body
+import logging
 import requests
 import os
 from fastapi.responses import HTMLResponse
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/api/users",
     tags=["Users"],
@@ -35,6 +38,10 @@ def update_user_me(
             detail="현재 비밀번호가 일치하지 않습니다."
         )
 
+    # 바꿀 항목이 없으면 커밋/refresh 없이 현재 정보 반환 (빈 쓰기 트랜잭션 방지)
+    if not user_update.name and not user_update.password:
+        return current_user
+
     # 2. 닉네임 변경 (입력된 경우만)
     if user_update.name:
         current_user.name = user_update.name
@@ -47,7 +54,6 @@ def update_user_me(
     # 4. DB 저장
     try:
         db.commit()
-        db.refresh(current_user)
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -77,6 +83,23 @@ def change_password_legacy(
 # TODO: 발급받은 Polar 토큰과 Product ID를 여기에 넣으세요! (보안을 위해 나중엔 .env로 빼는 것이 좋습니다)
 POLAR_ACCESS_TOKEN = os.getenv("POLAR_ACCESS_TOKEN")
 POLAR_PRODUCT_ID = os.getenv("POLAR_PRODUCT_ID")
+POLAR_MONTHLY_PRODUCT_ID = os.getenv("POLAR_MONTHLY_PRODUCT_ID")
+POLAR_YEARLY_PRODUCT_ID = os.getenv("POLAR_YEARLY_PRODUCT_ID")
+POLAR_TIMEOUT_SECONDS = 10
+
+_polar_session = None
+
+
+def _get_polar_session() -> requests.Session:
+    # 결제창 요청마다 api.polar.sh와 TLS 핸드셰이크를 새로 하지 않도록 커넥션 풀을 재사용
+    global _polar_session
+    if _polar_session is None:
+        _polar_session = requests.Session()
+        _polar_session.headers.update({
+            "Authorization": f"Bearer {POLAR_ACCESS_TOKEN}",
+            "Content-Type": "application/json",
+        })
+    return _polar_session
 
 @router.post("/polar/checkout")
 def create_polar_checkout(
@@ -84,14 +107,9 @@ def create_polar_checkout(
     current_user: contract.User = Depends(get_current_user)
 ):
     # 플랜 타입에 따라 ID 선택
-    product_id = os.getenv("POLAR_YEARLY_PRODUCT_ID") if plan_type == "yearly" else os.getenv("POLAR_MONTHLY_PRODUCT_ID")
+    product_id = POLAR_YEARLY_PRODUCT_ID if plan_type == "yearly" else POLAR_MONTHLY_PRODUCT_ID
     
     url = "https://api.polar.sh/v1/checkouts/custom/"
-    headers = {
-        "Authorization": f"Bearer {os.getenv('POLAR_ACCESS_TOKEN')}",
-        "Content-Type": "application/json"
-    }
-    
     payload = {
         "product_id": product_id, # 👈 선택된 ID 사용
         "customer_email": current_user.email,
@@ -99,10 +117,10 @@ def create_polar_checkout(
         "metadata": {"user_id": str(current_user.id), "plan": plan_type}
     }
     
-    response = requests.post(url, json=payload, headers=headers)
+    response = _get_polar_session().post(url, json=payload, timeout=POLAR_TIMEOUT_SECONDS)
     
     if not response.ok:
-        print("🚨 Polar API 에러 원인:", response.text)
+        logger.error("Polar API 에러 원인: %s", response.text)
         raise HTTPException(status_code=500, detail="결제창 생성에 실패했습니다.")
         
     data = response.json()
@@ -1,17 +1,49 @@
 # app/services/ai_advisor.py
 
+import hashlib
+import logging
 import os
 import re
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+import orjson
+from cachetools import TTLCache
 from openai import OpenAI
 from dotenv import load_dotenv
-from app.services.pdf_parser import extract_content_from_pdf
+from app.services.analyzer import OPENAI_TIMEOUT, _build_http_client
+from app.services.pdf_parser import SCAN_IMAGE_MIME, extract_content_from_pdf
 
 load_dotenv()
 
-# OpenAI 클라이언트 초기화
+logger = logging.getLogger(__name__)
+
+# OpenAI 클라이언트 초기화 (analyzer와 같은 HTTP/2 keep-alive 커넥션 풀 설정)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, http_client=_build_http_client())
+
+# 계약서 분석(LLM 호출) 동시 실행 상한 - 라우트는 스레드풀에서 돌기 때문에 스레드 세마포어로 제한
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "8"))
+_ANALYSIS_SLOTS = threading.BoundedSemaphore(ANALYSIS_CONCURRENCY)
+
+# (카테고리, 파일 SHA-256) → 분석 결과 JSON. 같은 PDF를 다시 올리면 파싱/LLM 호출 없이 재사용 (성공 결과만 저장)
+_RESULT_CACHE: TTLCache = TTLCache(maxsize=256, ttl=24 * 60 * 60)
+_RESULT_CACHE_LOCK = threading.Lock()
+
+# 분석이 끝난 업로드 파일 삭제는 응답을 기다리게 하지 않도록 백그라운드 스레드에서 처리
+_FILE_CLEANUP = ThreadPoolExecutor(max_workers=2, thread_name_prefix="openai-file-cleanup")
+
+# 스캔본 vision 분석에 넘기는 최대 페이지 수 (이 페이지까지만 렌더링)
+VISION_MAX_PAGES = 10
+# 텍스트 PDF는 원본 파일을 file_search로 넘기므로 추출 텍스트는 스캔본 판별에만 쓴다 (이만큼 모이면 파싱 중단)
+SCAN_CHECK_CHARS = 2000
+
+# Assistants Run 상태 폴링 간격: 0.5 → 1 → 2 → 4 → 4 ...초
+RUN_POLL_INITIAL_SECONDS = 0.5
+RUN_POLL_MAX_SECONDS = 4.0
+_RUN_PENDING_STATUSES = {"queued", "in_progress", "cancelling"}
 
 # 카테고리별 Assistant ID 매핑
 # (.env 파일에 이 이름대로 ID가 들어있어야 합니다)
@@ -59,16 +91,32 @@ INSTRUCTIONS_MAP = {
 }
 
 
+# _clean_json 정규식 (응답마다 re 모듈 캐시를 조회하지 않도록 모듈 로드 시 1회 컴파일)
+_FENCE_PATTERN = re.compile(r"^```json\s*|\s*```$", re.MULTILINE)
+_SOURCE_MARK_PATTERN = re.compile(r"【.*?】")
+_JSON_OBJECT_PATTERN = re.compile(r"(\{.*\})", re.DOTALL)
+
+
 def _clean_json(raw_text: str) -> str:
     """AI 응답에서 순수 JSON 문자열만 추출합니다."""
+    json_str = raw_text.strip()
+    # (0) 이미 순수 JSON 객체면 (출처 표기도 없으면) 정규식 정리 생략
+    if json_str.startswith("{") and "【" not in json_str:
+        try:
+            orjson.loads(json_str)
+            return json_str
+        except orjson.JSONDecodeError:
+            pass
+
     # (1) 마크다운 코드 블록 제거 (```json ... ```)
-    json_str = re.sub(r"^```json\s*|\s*```$", "", raw_text.strip(), flags=re.MULTILINE)
+    json_str = _FENCE_PATTERN.sub("", json_str)
     # (2) 출처 표기 제거 (【4:0†source】 등)
-    json_str = re.sub(r"【.*?】", "", json_str)
+    json_str = _SOURCE_MARK_PATTERN.sub("", json_str)
     # (3) 앞뒤 사족 제거하고 순수 JSON 객체만 추출 ({...})
-    match = re.search(r"(\{.*\})", json_str, re.DOTALL)
-    if match:
-        json_str = match.group(1)
+    if not (json_str.startswith("{") and json_str.endswith("}")):
+        match = _JSON_OBJECT_PATTERN.search(json_str)
+        if match:
+            json_str = match.group(1)
     return json_str
 
 
@@ -78,10 +126,10 @@ def _analyze_with_vision(instructions: str, images: list) -> str:
     카테고리별 프롬프트(instructions)를 그대로 사용합니다.
     """
     content = [{"type": "text", "text": instructions}]
-    for img_base64 in images[:10]:  # 최대 10페이지
+    for img_base64 in images[:VISION_MAX_PAGES]:
         content.append({
             "type": "image_url",
-            "image_url": {"url": f"data:image/png;base64,{img_base64}"},
+            "image_url": {"url": f"data:{SCAN_IMAGE_MIME};base64,{img_base64}"},
         })
 
     response = client.chat.completions.create(
@@ -115,37 +163,86 @@ def _analyze_with_vision(instructions: str, images: list) -> str:
     return response.choices[0].message.content or '{}'
 
 
-def analyze_contract(file_path: str, category: str) -> str:
+def _wait_for_run(run):
+    """Run이 끝날 때까지 간격을 늘려가며 조회 (고정 간격 폴링보다 API 호출 수가 적음)."""
+    delay = RUN_POLL_INITIAL_SECONDS
+    while run.status in _RUN_PENDING_STATUSES:
+        time.sleep(delay)
+        delay = min(delay * 2, RUN_POLL_MAX_SECONDS)
+        run = client.beta.threads.runs.retrieve(run.id, thread_id=run.thread_id)
+    return run
+
+
+def analyze_contract(file: Union[str, BinaryIO], category: str, filename: Optional[str] = None) -> str:
     """
     업로드된 계약서 파일을 분석하는 통합 함수.
     - 텍스트 PDF: OpenAI Assistants API (file_search)
     - 스캔본 PDF: GPT-4o vision (이미지 직접 전달)
 
-    :param file_path: 서버에 임시 저장된 파일 경로
+    :param file: 파일 경로 또는 바이너리 파일 객체 (업로드 스트림을 그대로 넘기면 임시 파일 저장이 필요 없음)
     :param category: "REAL_ESTATE", "WORK", "CONSUMER", "NDA", "GENERAL"
+    :param filename: OpenAI에 올릴 때 쓸 파일명 (생략 시 경로의 파일명)
     :return: 정제된 JSON 문자열
     """
+    # 파일은 한 번만 읽고 캐시 키 계산 / PDF 추출 / OpenAI 업로드에 재사용
+    file_bytes = _read_file_bytes(file)
+    cache_key = (category, hashlib.sha256(file_bytes).digest())
+    with _RESULT_CACHE_LOCK:
+        cached = _RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        logger.info("동일 파일 분석 결과 재사용 (category=%s)", category)
+        return cached
+
+    upload_name = Path(filename or (file if isinstance(file, str) else "")).name or "contract.pdf"
+    # 동시에 진행되는 분석 수를 제한 (초과 요청은 슬롯이 빌 때까지 대기)
+    with _ANALYSIS_SLOTS:
+        result = _analyze_contract(file_bytes, category, upload_name)
+
+    if _is_valid_result(result):
+        with _RESULT_CACHE_LOCK:
+            _RESULT_CACHE[cache_key] = result
+    return result
+
+
+def _is_valid_result(result: str) -> bool:
+    # 에러 응답이나 깨진 JSON/설명문이 캐시되면 같은 파일은 TTL 동안 재시도 없이 계속 실패하므로
+    # 라우터가 그대로 쓸 수 있는 분석 결과(summary/clauses를 가진 JSON 객체)만 저장
+    try:
+        parsed = orjson.loads(result)
+    except orjson.JSONDecodeError:
+        return False
+    return isinstance(parsed, dict) and "error" not in parsed and ("summary" in parsed or "clauses" in parsed)
+
+
+def _read_file_bytes(file: Union[str, BinaryIO]) -> bytes:
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            return f.read()
+    file.seek(0)
+    return file.read()
+
+
+def _analyze_contract(file_bytes: bytes, category: str, upload_name: str) -> str:
     instructions = INSTRUCTIONS_MAP.get(category)
     if not instructions:
         return '{"error": "잘못된 카테고리입니다."}'
 
     # 1. PDF에서 텍스트/이미지 추출
-    with open(file_path, "rb") as f:
-        file_bytes = f.read()
-
-    parsed = extract_content_from_pdf(file_bytes)
+    parsed = extract_content_from_pdf(
+        file_bytes, max_image_pages=VISION_MAX_PAGES, max_text_chars=SCAN_CHECK_CHARS
+    )
 
     # 2. 스캔본(이미지)이면 → GPT-4o vision으로 분석
     if parsed["type"] == "images":
-        print(f"[ai_advisor] 스캔본 감지 → GPT-4o vision 사용 (category={category})")
+        logger.info("스캔본 감지 → GPT-4o vision 사용 (category=%s)", category)
         try:
-            raw_text = _analyze_with_vision(instructions, parsed["content"])
-            return _clean_json(raw_text)
+            # response_format=json_object라 응답이 이미 순수 JSON (코드 블록/출처 표기 정리 불필요)
+            return _analyze_with_vision(instructions, parsed["content"]).strip()
         except Exception as e:
             return f'{{"error": "vision 분석 실패", "details": "{str(e)}"}}'
 
     # 3. 텍스트 PDF이면 → Assistants API (file_search)
-    print(f"[ai_advisor] 텍스트 PDF → Assistants API 사용 (category={category})")
+    logger.info("텍스트 PDF → Assistants API 사용 (category=%s)", category)
     assistant_id = ASSISTANT_MAP.get(category)
     if not assistant_id:
         return f'{{"error": "Assistant ID를 찾을 수 없습니다. (Category: {category})"}}'
@@ -153,37 +250,36 @@ def analyze_contract(file_path: str, category: str) -> str:
     user_file_obj = None
     try:
         # 3-1. OpenAI에 파일 업로드
-        with open(file_path, "rb") as f:
-            user_file_obj = client.files.create(
-                file=f,
-                purpose="assistants"
-            )
-
-        # 3-2. 스레드 생성 (메시지 + 파일 첨부)
-        thread = client.beta.threads.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": instructions,
-                    "attachments": [
-                        {
-                            "file_id": user_file_obj.id,
-                            "tools": [{"type": "file_search"}]
-                        }
-                    ]
-                }
-            ]
+        user_file_obj = client.files.create(
+            file=(upload_name, file_bytes),
+            purpose="assistants"
         )
 
-        # 3-3. 실행 (Run & Poll)
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant_id
+        # 3-2. 스레드 생성 + 실행 (Run & Poll)
+        # 스레드를 따로 만들지 않고 한 번의 요청으로 생성과 실행을 같이 처리
+        run = client.beta.threads.create_and_run(
+            assistant_id=assistant_id,
+            thread={
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": instructions,
+                        "attachments": [
+                            {
+                                "file_id": user_file_obj.id,
+                                "tools": [{"type": "file_search"}]
+                            }
+                        ]
+                    }
+                ]
+            },
         )
+        run = _wait_for_run(run)
 
-        # 3-4. 결과 받기 및 정제
+        # 3-3. 결과 받기 및 정제
         if run.status == 'completed':
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
+            # 마지막 답변 하나만 필요하므로 최신 메시지 1건만 조회
+            messages = client.beta.threads.messages.list(thread_id=run.thread_id, run_id=run.id, limit=1)
             raw_text = messages.data[0].content[0].text.value
             return _clean_json(raw_text)
         else:
@@ -193,9 +289,13 @@ def analyze_contract(file_path: str, category: str) -> str:
         return f'{{"error": "서버 내부 에러", "details": "{str(e)}"}}'
 
     finally:
-        # 3-5. OpenAI 서버에 올린 파일 삭제 (용량 관리)
+        # 3-4. OpenAI 서버에 올린 파일 삭제 (용량 관리) - 응답 반환과 겹치도록 백그라운드로 넘김
         if user_file_obj:
-            try:
-                client.files.delete(user_file_obj.id)
-            except Exception:
-                pass
+            _FILE_CLEANUP.submit(_delete_uploaded_file, user_file_obj.id)
+
+
+def _delete_uploaded_file(file_id: str) -> None:
+    try:
+        client.files.delete(file_id)
+    except Exception as e:
+        logger.warning("OpenAI 업로드 파일 삭제 실패 (%s): %s", file_id, e)
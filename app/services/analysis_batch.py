@@ -0,0 +1,186 @@
+# app/services/analysis_batch.py
+# 비대화형 계약서 분석: OpenAI Batch API (동기 호출 대비 토큰 비용 50%, 별도 rate limit 한도 사용)
+# - submit_analysis_batch: 분석 요청 1건을 JSONL로 올리고 batch 생성 → batch id 반환
+# - cancel_analysis_batch: 문서에 연결하지 못한 batch 취소
+# - poll_pending_batches: status='pending' 문서의 batch를 확인해 끝났으면 결과 저장 / 실패 처리
+# - start_poller / stop_poller: 서버 기동 시 백그라운드 스레드로 주기적으로 확인
+#   (uvicorn 워커가 여러 개면 파일 락을 잡은 워커 하나만 폴링, 그 워커가 죽으면 다음 주기에 다른 워커가 이어받음)
+
+import logging
+import os
+import random
+import tempfile
+import threading
+import uuid
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 로컬 개발 환경
+    fcntl = None
+
+import orjson
+
+from app.core.database import SessionLocal
+from app.models.contract import Document
+from app.services.analyzer import _get_client, build_analysis_request, parse_analysis_response
+from app.services.report_service import save_clause_results
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# batch 상태 확인 주기(초), 0이면 폴링 스레드를 띄우지 않음
+BATCH_POLL_SECONDS = int(os.getenv("ANALYSIS_BATCH_POLL_SECONDS", "60"))
+_FAILED_STATUSES = {"failed", "expired", "cancelled"}
+# 같은 호스트의 워커 중 폴링을 맡을 프로세스를 고르는 락 파일
+POLLER_LOCK_PATH = os.path.join(tempfile.gettempdir(), "readgye-analysis-batch-poller.lock")
+
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+_LOCK_FILE = None
+
+
+def submit_analysis_batch(data: dict, document_id: uuid.UUID) -> str:
+    """PDF 추출 결과로 batch를 생성하고 batch id를 반환한다. (custom_id = 문서 id)"""
+    client = _get_client()
+    line = orjson.dumps({
+        "custom_id": str(document_id),
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": build_analysis_request(data),
+    })
+    input_file = client.files.create(file=("analysis.jsonl", line + b"\n"), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+    logger.info("분석 batch 생성: %s (document=%s)", batch.id, document_id)
+    return batch.id
+
+
+def cancel_analysis_batch(batch_id: str) -> None:
+    """문서에 연결하지 못한 batch를 취소한다. (실패해도 예외를 올리지 않음)"""
+    try:
+        _get_client().batches.cancel(batch_id)
+    except Exception:
+        logger.warning("분석 batch 취소 실패: %s", batch_id, exc_info=True)
+
+
+def _read_batch_result(client, output_file_id: str) -> dict:
+    # batch 1개에 요청 1건만 넣으므로 첫 줄이 이 문서의 결과
+    output = client.files.content(output_file_id).read()
+    line = orjson.loads(output.splitlines()[0])
+    response = line.get("response") or {}
+    if response.get("status_code") != 200:
+        raise RuntimeError(f"batch 요청 실패: {line.get('error') or response.get('status_code')}")
+    raw = response["body"]["choices"][0]["message"]["content"] or '{}'
+    return parse_analysis_response(raw)
+
+
+def _finish_document(document_id: uuid.UUID, status: str, clauses_data: Optional[list] = None) -> bool:
+    """pending 상태일 때만 상태를 바꾸고 결과를 저장. (여러 워커가 같은 문서를 폴링해도 한 번만 반영)"""
+    with SessionLocal() as db:
+        claimed = (
+            db.query(Document)
+            .filter(Document.id == document_id, Document.status == 'pending')
+            .update({Document.status: status}, synchronize_session=False)
+        )
+        if not claimed:
+            db.rollback()
+            return False
+        if clauses_data is not None:
+            save_clause_results(db, document=db.get(Document, document_id), clauses_data=clauses_data)
+        db.commit()
+    return True
+
+
+def poll_pending_batches() -> int:
+    """진행 중인 batch를 확인해 완료/실패한 문서를 반영하고, 반영한 문서 수를 반환한다."""
+    with SessionLocal() as db:
+        pending = (
+            db.query(Document.id, Document.openai_batch_id)
+            .filter(Document.status == 'pending', Document.openai_batch_id.isnot(None))
+            .all()
+        )
+    if not pending:
+        return 0
+
+    client = _get_client()
+    finished = 0
+    for document_id, batch_id in pending:
+        try:
+            batch = client.batches.retrieve(batch_id)
+            if batch.status == 'completed' and batch.output_file_id:
+                try:
+                    result = _read_batch_result(client, batch.output_file_id)
+                except Exception:
+                    # 응답 형식 오류는 다시 폴링해도 같으므로 실패로 처리
+                    logger.exception("분석 batch 결과 해석 실패: %s (document=%s)", batch.id, document_id)
+                    finished += _finish_document(document_id, 'failed')
+                    continue
+                finished += _finish_document(document_id, 'done', result['clauses'])
+            elif batch.status in _FAILED_STATUSES or batch.status == 'completed':
+                logger.warning("분석 batch 실패: %s (%s, document=%s)", batch.id, batch.status, document_id)
+                finished += _finish_document(document_id, 'failed')
+        except Exception:
+            logger.exception("분석 batch 처리 실패 (document=%s)", document_id)
+    return finished
+
+
+def _acquire_poller_lock() -> bool:
+    global _LOCK_FILE
+
+    if _LOCK_FILE is not None:
+        return True
+    if fcntl is None:
+        return True
+
+    lock_file = open(POLLER_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    # 프로세스가 끝나면 OS가 락을 풀어 준다
+    _LOCK_FILE = lock_file
+    return True
+
+
+def _release_poller_lock() -> None:
+    global _LOCK_FILE
+
+    if _LOCK_FILE is not None:
+        _LOCK_FILE.close()
+        _LOCK_FILE = None
+
+
+def _poll_loop() -> None:
+    # 워커들이 같은 시각에 깨어나지 않도록 주기에 ±10% 지터
+    while not _STOP.wait(BATCH_POLL_SECONDS * random.uniform(0.9, 1.1)):
+        try:
+            if _acquire_poller_lock():
+                poll_pending_batches()
+        except Exception:
+            logger.exception("분석 batch 폴링 실패")
+
+
+def start_poller() -> None:
+    global _THREAD
+
+    if BATCH_POLL_SECONDS <= 0 or _THREAD is not None:
+        return
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_poll_loop, name="analysis-batch-poller", daemon=True)
+    _THREAD.start()
+
+
+def stop_poller() -> None:
+    global _THREAD
+
+    _STOP.set()
+    if _THREAD is not None:
+        _THREAD.join(timeout=5)
+        _THREAD = None
+    _release_poller_lock()
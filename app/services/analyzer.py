@@ -1,28 +1,36 @@
-﻿import json
+﻿import hashlib
+import logging
 import os
+import threading
 from pathlib import Path
 
+import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import dotenv_values, load_dotenv
-from openai import OpenAI
+from openai import DefaultHttpxClient, OpenAI
+
+from app.services.pdf_parser import SCAN_IMAGE_MIME
 
 ENV_PATH = Path(__file__).resolve().parents[2] / '.env'
 load_dotenv(ENV_PATH, override=True)
 
+logger = logging.getLogger(__name__)
 
-def _get_client() -> OpenAI:
-    # Railway 등 배포 환경: 환경변수 우선, 로컬: .env 파일 폴백
-    api_key = os.getenv('OPENAI_API_KEY', '').strip()
-    if not api_key:
-        env_file_values = dotenv_values(ENV_PATH)
-        api_key = (env_file_values.get('OPENAI_API_KEY') or '').strip()
-    if not api_key:
-        raise RuntimeError('OPENAI_API_KEY is missing')
-    return OpenAI(api_key=api_key)
 
+# 프로세스당 1개만 만들어 keep-alive 커넥션 풀을 재사용 (호출마다 TCP/TLS 핸드셰이크 방지)
+# HTTP/2로 커넥션 하나에 여러 요청을 다중화 (h2 패키지 필요: httpx[http2])
+OPENAI_MAX_CONNECTIONS = 32
+OPENAI_MAX_KEEPALIVE = 16
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
 
-def analyze_contract(data: dict) -> dict:
-    """텍스트 또는 이미지 데이터를 받아 계약 조항을 분석합니다."""
-    system_prompt = """
+# 스캔본은 앞쪽 몇 페이지만 분석에 사용 (PDF 파싱도 이 페이지까지만 렌더링)
+VISION_MAX_PAGES = 3
+# 텍스트 PDF는 앞쪽 이 글자수까지만 분석에 사용 (PDF 파싱도 이만큼 모이면 중단)
+MAX_TEXT_CHARS = 15000
+
+ANALYZE_MODEL = 'gpt-4o-mini'
+SYSTEM_PROMPT = """
     너는 전문 변호사야. 제공된 계약서(텍스트 또는 이미지)를 분석해서 독소 조항을 찾아줘.
     반드시 아래 JSON 포맷으로만 응답해:
     {
@@ -33,32 +41,80 @@ def analyze_contract(data: dict) -> dict:
     중요: "body" 필드에는 해당 조항의 원문 텍스트를 최대한 그대로 포함해야 해. 원문이 없으면 빈 문자열로 남겨.
     """
 
+# OpenAI 프롬프트 캐싱 라우팅 키 (고정된 시스템 프롬프트가 항상 앞에 오므로 같은 키로 보냄)
+PROMPT_CACHE_KEY = 'readgye-analyze'
+
+# SHA-256(요청 본문: 모델 + 시스템 프롬프트 + 계약서 내용) → GPT 응답 원문. 같은 계약서를 다시 올리면 API 호출 생략
+# (형식 검증을 통과한 응답만 저장, 꺼낼 때마다 새로 파싱해 호출 측이 결과를 수정해도 캐시에 영향 없음)
+_RESPONSE_CACHE: TTLCache = TTLCache(maxsize=1000, ttl=60 * 60)
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_client() -> OpenAI:
+    global _CLIENT
+
+    if _CLIENT is not None:
+        return _CLIENT
+
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            return _CLIENT
+
+        # Railway 등 배포 환경: 환경변수 우선, 로컬: .env 파일 폴백
+        api_key = os.getenv('OPENAI_API_KEY', '').strip()
+        if not api_key:
+            env_file_values = dotenv_values(ENV_PATH)
+            api_key = (env_file_values.get('OPENAI_API_KEY') or '').strip()
+        if not api_key:
+            raise RuntimeError('OPENAI_API_KEY is missing')
+
+        _CLIENT = OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, http_client=_build_http_client())
+        return _CLIENT
+
+
+def _build_http_client() -> httpx.Client:
+    return DefaultHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+        ),
+    )
+
+
+def build_analysis_request(data: dict) -> dict:
+    """PDF 추출 결과로 chat.completions 요청 본문을 만든다. (동기 호출/Batch API 공용)"""
     content = [{"type": "text", "text": "이 계약서를 분석해서 독소 조항을 찾아줘."}]
 
     if data.get('type') == 'text':
-        text_body = (data.get('content') or '')[:15000]
+        text_body = (data.get('content') or '')[:MAX_TEXT_CHARS]
         content[0]['text'] += f"\n\n계약서 내용:\n{text_body}"
     else:
-        for img_base64 in (data.get('content') or [])[:3]:
+        for img_base64 in (data.get('content') or [])[:VISION_MAX_PAGES]:
             content.append(
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{img_base64}"},
+                    "image_url": {"url": f"data:{SCAN_IMAGE_MIME};base64,{img_base64}"},
                 }
             )
 
-    client = _get_client()
-    response = client.chat.completions.create(
-        model='gpt-4o-mini',
-        messages=[
-            {"role": "system", "content": system_prompt},
+    return {
+        "model": ANALYZE_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": content},
         ],
-        response_format={"type": "json_object"},
-    )
+        "response_format": {"type": "json_object"},
+        "prompt_cache_key": PROMPT_CACHE_KEY,
+    }
 
-    raw = response.choices[0].message.content or '{}'
-    result = json.loads(raw)
+
+def parse_analysis_response(raw: str) -> dict:
+    """GPT 응답 JSON을 검증하고, 조항이 없으면 안내용 요약 조항을 돌려준다."""
+    result = orjson.loads(raw)
 
     if not isinstance(result, dict) or not isinstance(result.get('clauses'), list):
         raise RuntimeError("Invalid AI response format: 'clauses' list is missing.")
@@ -77,3 +133,35 @@ def analyze_contract(data: dict) -> dict:
         }
 
     return result
+
+
+def analyze_contract(data: dict) -> dict:
+    """텍스트 또는 이미지 데이터를 받아 계약 조항을 분석합니다."""
+    request = build_analysis_request(data)
+
+    cache_key = hashlib.sha256(orjson.dumps(request)).digest()
+    with _RESPONSE_CACHE_LOCK:
+        raw = _RESPONSE_CACHE.get(cache_key)
+
+    if raw is not None:
+        logger.info("동일 계약서 분석 응답 재사용")
+        return parse_analysis_response(raw)
+
+    client = _get_client()
+    response = client.chat.completions.create(**request)
+    usage = response.usage
+    if usage:
+        details = getattr(usage, "prompt_tokens_details", None)
+        logger.info(
+            "분석 GPT 토큰 사용: prompt=%d (캐시 %d), completion=%d",
+            usage.prompt_tokens,
+            getattr(details, "cached_tokens", None) or 0,
+            usage.completion_tokens,
+        )
+    raw = response.choices[0].message.content or '{}'
+
+    result = parse_analysis_response(raw)
+    # 형식 검증을 통과한 응답만 저장
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[cache_key] = raw
+    return result
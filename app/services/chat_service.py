@@ -1,14 +1,19 @@
 # app/services/chat_service.py
 # RAG 챗봇 핵심 로직: 컨텍스트 구성 → GPT 호출 → 대화 저장
 
+import datetime
 import logging
 import uuid
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional, Tuple
 
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 
-from app.models.contract import ChatMessage, ChatSession
-from app.rag.retriever import retrieve_relevant_context
+from app.core.database import ReadSessionLocal
+from app.models.contract import ChatMessage, ChatSession, _utcnow
+from app.rag.retriever import embed_query, retrieve_relevant_context
+from app.services import semantic_cache
 from app.services.analyzer import _get_client
 
 logger = logging.getLogger(__name__)
@@ -32,9 +37,15 @@ SYSTEM_PROMPT_TEMPLATE = """너는 "똑똑 AI"라는 법률 계약서 분석 AI
 
 {context}
 """
+# 컨텍스트 앞뒤 고정 문구를 미리 나눠 두고 매 턴에는 이어 붙이기만 함 (str.format 파싱 생략)
+_PROMPT_PREFIX, _PROMPT_SUFFIX = SYSTEM_PROMPT_TEMPLATE.split("{context}")
 
 MAX_HISTORY_MESSAGES = 10  # 멀티턴 컨텍스트에 포함할 최근 메시지 수
 MAX_CONTEXT_CHARS = 12000  # 컨텍스트 최대 글자수 (gpt-4o-mini 128k 기준 여유 확보)
+FALLBACK_ANSWER = "죄송합니다, 응답을 생성하지 못했습니다."
+# OpenAI 프롬프트 캐싱: 시스템 프롬프트 고정 부분(컨텍스트 앞)이 항상 메시지 맨 앞에 오므로,
+# 같은 키로 보내 같은 캐시 서버로 라우팅되게 한다 (1024 토큰 이상이면 자동 캐시, 적중 시 입력 토큰 할인)
+PROMPT_CACHE_KEY = "readgye-chat"
 
 
 def get_or_create_session(
@@ -42,16 +53,36 @@ def get_or_create_session(
     user_id: uuid.UUID,
     session_id: Optional[uuid.UUID],
     document_id: Optional[uuid.UUID],
-) -> ChatSession:
-    """기존 세션을 가져오거나 새 세션을 생성."""
+) -> Tuple[ChatSession, list[dict]]:
+    """
+    기존 세션과 최근 대화 히스토리({"role", "content"}, 시간순)를 가져오거나 새 세션을 생성.
+    (새 세션은 아직 db에 추가하지 않은 transient 객체 → 첫 메시지 저장 때 함께 기록)
+    """
     if session_id:
-        session = (
-            db.query(ChatSession)
+        # 세션 + 최근 N개 메시지를 한 번의 쿼리로 조회
+        # 최근 메시지는 ix_chat_messages_session_created 인덱스를 역순으로 읽는 파생 테이블로 제한하고,
+        # ORM 객체 대신 필요한 컬럼만 가져와 GPT 메시지 형태로 바로 변환
+        recent = (
+            select(ChatMessage.session_id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at)
+            .where(ChatMessage.session_id == session_id)
+            .order_by(ChatMessage.created_at.desc())
+            .limit(MAX_HISTORY_MESSAGES)
+            .subquery()
+        )
+        rows = (
+            db.query(ChatSession, recent.c.role, recent.c.content)
+            .outerjoin(recent, recent.c.session_id == ChatSession.id)
             .filter(ChatSession.id == session_id, ChatSession.user_id == user_id)
-            .first()
+            .order_by(recent.c.created_at.desc())
+            .all()
         )
-        if session:
-            return session
+        if rows:
+            history = [
+                {"role": role, "content": content}
+                for _, role, content in reversed(rows)  # 시간순 정렬
+                if role is not None
+            ]
+            return rows[0][0], history
 
     # 새 세션 생성
     session = ChatSession(
@@ -60,112 +91,275 @@ def get_or_create_session(
         document_id=document_id,
         title="새 상담",
     )
-    db.add(session)
-    db.flush()
-    return session
+    return session, []
 
 
-def chat_with_context(
-    db: Session,
+def _build_messages(
+    *,
+    session: ChatSession,
     user_id: uuid.UUID,
     user_message: str,
-    session_id: Optional[uuid.UUID] = None,
-    document_id: Optional[uuid.UUID] = None,
-    top_k: int = 6,
-    min_similarity: float = 0.35,
-    use_rerank: bool = True,
-) -> Tuple[ChatSession, ChatMessage, list]:
-    """
-    채팅 메시지 처리 전체 파이프라인:
-    1. 세션 관리
-    2. 계약서 컨텍스트 구성
-    3. 대화 히스토리 로드
-    4. GPT-4o-mini 호출
-    5. 메시지 저장
-    """
-    # 1. 세션
-    session = get_or_create_session(db, user_id, session_id, document_id)
-    effective_doc_id = document_id or session.document_id
-
-    # 2. 질문 기반 벡터 검색 컨텍스트 구성 (실패 시 내부 fallback)
-    retrieval = retrieve_relevant_context(
-        db=db,
-        user_id=user_id,
-        query_text=user_message,
-        document_id=effective_doc_id,
-        top_k=top_k,
-        min_similarity=min_similarity,
-        use_rerank=use_rerank,
-    )
+    history: list[dict],
+    document_id: Optional[uuid.UUID],
+    top_k: int,
+    min_similarity: float,
+    use_rerank: bool,
+) -> Tuple[list[dict], list]:
+    """질문 기반 컨텍스트 검색 후 GPT 메시지를 구성. (messages, citations) 반환."""
+    # 질문 기반 벡터 검색 컨텍스트 구성 (실패 시 내부 fallback)
+    # 조회 전용 세션을 사용해 쓰기 트랜잭션과 분리
+    with ReadSessionLocal() as read_db:
+        retrieval = retrieve_relevant_context(
+            db=read_db,
+            user_id=user_id,
+            query_text=user_message,
+            document_id=document_id,
+            top_k=top_k,
+            min_similarity=min_similarity,
+            use_rerank=use_rerank,
+        )
     context_text = retrieval.context
     if len(context_text) > MAX_CONTEXT_CHARS:
         context_text = context_text[:MAX_CONTEXT_CHARS] + "\n\n... (일부 생략됨)"
         logger.warning("컨텍스트 길이 초과 → %d자로 잘림 (session=%s)", MAX_CONTEXT_CHARS, session.id)
-    system_prompt = SYSTEM_PROMPT_TEMPLATE.format(context=context_text)
-
-    # 3. 대화 히스토리 로드
-    history = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.session_id == session.id)
-        .order_by(ChatMessage.created_at.desc())
-        .limit(MAX_HISTORY_MESSAGES)
-        .all()
-    )
-    history.reverse()  # 시간순 정렬
+    system_prompt = _PROMPT_PREFIX + context_text + _PROMPT_SUFFIX
 
-    # 4. GPT 메시지 구성
+    # GPT 메시지 구성
     messages = [{"role": "system", "content": system_prompt}]
-    for msg in history:
-        messages.append({"role": msg.role, "content": msg.content})
+    messages.extend(history)
     messages.append({"role": "user", "content": user_message})
 
-    # 5. 사용자 메시지 저장
-    user_msg = ChatMessage(
-        id=uuid.uuid4(),
-        session_id=session.id,
-        role="user",
-        content=user_message,
-    )
-    db.add(user_msg)
-    db.flush()
+    # 로그용 글자수 합계는 INFO 로그가 실제로 찍힐 때만 계산
+    if logger.isEnabledFor(logging.INFO):
+        total_chars = sum(len(m["content"]) for m in messages)
+        logger.info("GPT 호출: 메시지 %d개, 총 %d자 (session=%s)", len(messages), total_chars, session.id)
+    return messages, retrieval.citations
 
-    # 6. GPT 호출
-    client = _get_client()
-    total_chars = sum(len(m["content"]) for m in messages)
-    logger.info("GPT 호출: 메시지 %d개, 총 %d자 (session=%s)", len(messages), total_chars, session.id)
 
+def _log_usage(usage) -> None:
+    if usage:
+        details = getattr(usage, "prompt_tokens_details", None)
+        logger.info(
+            "GPT 토큰 사용: prompt=%d (캐시 %d), completion=%d, total=%d",
+            usage.prompt_tokens,
+            getattr(details, "cached_tokens", None) or 0,
+            usage.completion_tokens,
+            usage.total_tokens,
+        )
+
+
+def _generate_answer(messages: list[dict]) -> str:
+    client = _get_client()
     response = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
         temperature=0.7,
         max_tokens=2000,
+        prompt_cache_key=PROMPT_CACHE_KEY,
     )
+    _log_usage(response.usage)
+    return response.choices[0].message.content or FALLBACK_ANSWER
+
 
-    assistant_content = (
-        response.choices[0].message.content
-        or "죄송합니다, 응답을 생성하지 못했습니다."
+def _stream_answer(messages: list[dict]) -> Iterator[str]:
+    """stream=True로 호출해 토큰 조각을 생성되는 대로 내보낸다."""
+    client = _get_client()
+    stream = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=2000,
+        prompt_cache_key=PROMPT_CACHE_KEY,
+        stream=True,
+        stream_options={"include_usage": True},
     )
+    for chunk in stream:
+        # 마지막 청크는 choices 없이 usage만 담겨 온다
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+        if chunk.usage:
+            _log_usage(chunk.usage)
 
-    if response.usage:
-        logger.info(
-            "GPT 토큰 사용: prompt=%d, completion=%d, total=%d",
-            response.usage.prompt_tokens,
-            response.usage.completion_tokens,
-            response.usage.total_tokens,
-        )
 
-    # 7. AI 응답 저장
+@dataclass
+class _ChatTurn:
+    session: ChatSession
+    history: list[dict]  # 최근 메시지 ({"role", "content"}), 시간순
+    document_id: Optional[uuid.UUID]
+    cache_scope: semantic_cache.Scope
+    query_embedding: Optional[list[float]]
+    user_created_at: datetime.datetime  # 질문 시각 (사용자 메시지는 응답과 함께 저장)
+
+
+def _start_turn(
+    db: Session,
+    *,
+    user_id: uuid.UUID,
+    user_message: str,
+    session_id: Optional[uuid.UUID],
+    document_id: Optional[uuid.UUID],
+    top_k: int,
+    min_similarity: float,
+    use_rerank: bool,
+) -> _ChatTurn:
+    """세션/히스토리 로드 → (첫 질문이면) 질문 임베딩."""
+    # 1. 세션 + 대화 히스토리 (새 세션이면 히스토리 없음)
+    session, history = get_or_create_session(db, user_id, session_id, document_id)
+    effective_doc_id = document_id or session.document_id
+
+    # 여기까지는 조회만 했으므로(인증/문서 확인 포함) 트랜잭션을 끝내 GPT 호출·스트리밍(수~수십 초) 동안 커넥션을 풀에 돌려준다
+    # 새 세션은 아직 세션에 추가하지 않았으므로 이 커밋에 포함되지 않는다
+    db.commit()
+
+    # 첫 질문만 시맨틱 캐시 대상 (히스토리가 있으면 답이 달라지므로 캐시하지 않음)
+    return _ChatTurn(
+        session=session,
+        history=history,
+        document_id=effective_doc_id,
+        cache_scope=(user_id, effective_doc_id, top_k, min_similarity, use_rerank),
+        query_embedding=embed_query(user_message) if not history else None,
+        user_created_at=_utcnow(),
+    )
+
+
+def _finish_turn(db: Session, turn: _ChatTurn, user_message: str, assistant_content: str) -> ChatMessage:
+    """질문/응답 저장 + 첫 질문이면 세션 제목 업데이트."""
     assistant_msg = ChatMessage(
         id=uuid.uuid4(),
-        session_id=session.id,
+        session_id=turn.session.id,
         role="assistant",
         content=assistant_content,
+        created_at=_utcnow(),
+    )
+    if len(turn.history) == 0:
+        turn.session.title = user_message[:50]
+    db.add(turn.session)  # 새 세션이면 여기서 처음 추가 (기존 세션은 이미 세션에 있음)
+    db.flush()  # 새 세션이면 메시지보다 먼저 기록 (FK)
+    # 질문과 응답을 한 번의 INSERT(executemany)로 저장 (GPT 호출 동안 쓰기 트랜잭션을 열어두지 않음)
+    db.execute(insert(ChatMessage), [
+        {
+            "id": uuid.uuid4(),
+            "session_id": turn.session.id,
+            "role": "user",
+            "content": user_message,
+            "created_at": turn.user_created_at,
+        },
+        {
+            "id": assistant_msg.id,
+            "session_id": assistant_msg.session_id,
+            "role": assistant_msg.role,
+            "content": assistant_msg.content,
+            "created_at": assistant_msg.created_at,
+        },
+    ])
+    return assistant_msg
+
+
+def chat_with_context(
+    db: Session,
+    user_id: uuid.UUID,
+    user_message: str,
+    session_id: Optional[uuid.UUID] = None,
+    document_id: Optional[uuid.UUID] = None,
+    top_k: int = 6,
+    min_similarity: float = 0.35,
+    use_rerank: bool = True,
+) -> Tuple[ChatSession, ChatMessage, list]:
+    """
+    채팅 메시지 처리 전체 파이프라인:
+    1. 세션 관리
+    2. 대화 히스토리 로드
+    3. 계약서 컨텍스트 구성 + GPT-4o-mini 호출 (첫 질문은 시맨틱 캐시 우선)
+    4. 질문/응답 메시지 저장
+    """
+    turn = _start_turn(
+        db,
+        user_id=user_id,
+        user_message=user_message,
+        session_id=session_id,
+        document_id=document_id,
+        top_k=top_k,
+        min_similarity=min_similarity,
+        use_rerank=use_rerank,
     )
-    db.add(assistant_msg)
-    db.flush()
 
-    # 8. 첫 질문이면 세션 제목 업데이트
-    if len(history) == 0:
-        session.title = user_message[:50]
+    cached = semantic_cache.lookup(turn.cache_scope, turn.query_embedding) if turn.query_embedding else None
+    if cached is not None:
+        logger.info("시맨틱 캐시 적중 → 검색/GPT 호출 생략 (session=%s)", turn.session.id)
+        assistant_content, citations = cached
+    else:
+        messages, citations = _build_messages(
+            session=turn.session,
+            user_id=user_id,
+            user_message=user_message,
+            history=turn.history,
+            document_id=turn.document_id,
+            top_k=top_k,
+            min_similarity=min_similarity,
+            use_rerank=use_rerank,
+        )
+        assistant_content = _generate_answer(messages)
+        if turn.query_embedding:
+            semantic_cache.store(turn.cache_scope, turn.query_embedding, assistant_content, citations)
+
+    assistant_msg = _finish_turn(db, turn, user_message, assistant_content)
+    return turn.session, assistant_msg, citations
+
+
+def stream_chat_with_context(
+    db: Session,
+    user_id: uuid.UUID,
+    user_message: str,
+    session_id: Optional[uuid.UUID] = None,
+    document_id: Optional[uuid.UUID] = None,
+    top_k: int = 6,
+    min_similarity: float = 0.35,
+    use_rerank: bool = True,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    chat_with_context의 스트리밍 버전.
+    ("delta", 텍스트 조각)을 생성되는 대로 내보내고, 응답 저장/커밋 후 마지막에 ("done", (세션, 응답 메시지, citations))을 낸다.
+    """
+    turn = _start_turn(
+        db,
+        user_id=user_id,
+        user_message=user_message,
+        session_id=session_id,
+        document_id=document_id,
+        top_k=top_k,
+        min_similarity=min_similarity,
+        use_rerank=use_rerank,
+    )
+
+    cached = semantic_cache.lookup(turn.cache_scope, turn.query_embedding) if turn.query_embedding else None
+    if cached is not None:
+        logger.info("시맨틱 캐시 적중 → 검색/GPT 호출 생략 (session=%s)", turn.session.id)
+        assistant_content, citations = cached
+        yield "delta", assistant_content
+    else:
+        messages, citations = _build_messages(
+            session=turn.session,
+            user_id=user_id,
+            user_message=user_message,
+            history=turn.history,
+            document_id=turn.document_id,
+            top_k=top_k,
+            min_similarity=min_similarity,
+            use_rerank=use_rerank,
+        )
+        parts: list[str] = []
+        for delta in _stream_answer(messages):
+            parts.append(delta)
+            yield "delta", delta
+        assistant_content = "".join(parts)
+        if not assistant_content:
+            assistant_content = FALLBACK_ANSWER
+            yield "delta", assistant_content
+        if turn.query_embedding:
+            semantic_cache.store(turn.cache_scope, turn.query_embedding, assistant_content, citations)
 
-    return session, assistant_msg, retrieval.citations
+    assistant_msg = _finish_turn(db, turn, user_message, assistant_content)
+    db.commit()
+    yield "done", (turn.session, assistant_msg, citations)
@@ -23,6 +23,6 @@ def create_analysis_done_notification(
         message=message,
         is_read=False,
     )
+    # flush/commit은 호출 측 트랜잭션에 맡긴다 (문서·조항과 함께 커밋 1회로 기록)
     db.add(notification)
-    db.flush()
     return notification
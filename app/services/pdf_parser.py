@@ -2,26 +2,200 @@
 
 import fitz # PyMuPDF
 import base64
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import Optional, Union
 
-def extract_content_from_pdf(file_content: bytes):
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# PyMuPDF는 텍스트 추출/렌더링 동안 GIL을 잡고 있어 스레드풀에서 돌리면 다른 요청까지 멈춘다
+# → 별도 프로세스 풀에서 파싱 (0이면 요청 스레드에서 바로 실행)
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# 스캔본 페이지는 PNG 대신 JPEG로 인코딩 (zlib 압축 CPU와 vision 요청 업로드 크기를 줄임)
+SCAN_IMAGE_MIME = "image/jpeg"
+SCAN_JPEG_QUALITY = int(os.getenv("SCAN_JPEG_QUALITY", "85"))
+
+# blake2b(PDF 내용) → 텍스트 추출 결과. 같은 파일을 다시 올릴 때 fitz 파싱 생략
+# - 스캔본(페이지 이미지)은 워커마다 수 MB씩 차지하고, 같은 파일은 분석 결과 캐시(ai_advisor/analyzer)가 먼저 받으므로 저장하지 않는다
+# - 항목 수가 아니라 텍스트 총 글자 수로 크기를 제한
+PARSE_CACHE_MAX_CHARS = 2_000_000
+_PARSE_CACHE: TTLCache = TTLCache(
+    maxsize=PARSE_CACHE_MAX_CHARS,
+    ttl=10 * 60,
+    getsizeof=lambda parsed: max(len(parsed["content"]), 1),
+)
+_PARSE_CACHE_LOCK = threading.Lock()
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool():
+    global _POOL
+
+    if PDF_PARSE_WORKERS <= 0:
+        return None
+    if _POOL is not None:
+        return _POOL
+
+    with _POOL_LOCK:
+        if _POOL is None:
+            # 스레드가 여러 개 떠 있는 서버 프로세스를 fork하지 않도록 spawn 사용
+            _POOL = ProcessPoolExecutor(
+                max_workers=PDF_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _POOL
+
+
+def shutdown_pool() -> None:
+    global _POOL
+
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_content_from_pdf(
+    file_content: Union[bytes, str],
+    max_image_pages: Optional[int] = None,
+    max_text_chars: Optional[int] = None,
+):
     """
     텍스트 추출을 시도하고, 텍스트가 부족하면 이미지(Base64) 리스트를 반환합니다.
+    파일 경로를 넘기면 워커가 파일을 직접 열어 PDF 바이트를 프로세스 간에 복사하지 않습니다.
+    스캔본은 페이지별로 나눠 여러 워커에서 동시에 렌더링합니다 (순서 유지).
+    max_image_pages를 주면 스캔본은 앞쪽 N페이지만 렌더링합니다 (분석에 쓰는 페이지만 변환).
+    max_text_chars를 주면 그만큼 텍스트가 모인 뒤의 페이지는 읽지 않습니다 (뒤에서 잘라 쓰는 경우).
+    텍스트 추출 결과는 파일 내용 해시로 잠시 캐시합니다.
     """
-    doc = fitz.open(stream=file_content, filetype="pdf")
-    text = ""
-    for page in doc:
-        text += page.get_text()
+    cache_key = (_content_digest(file_content), max_image_pages, max_text_chars)
+    with _PARSE_CACHE_LOCK:
+        cached = _PARSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
 
-    # 텍스트가 50자 미만이면 스캔본으로 간주
-    if len(text.strip()) < 50:
-        print("🔍 스캔본 PDF 감지: 이미지 변환을 시작합니다.")
-        base64_images = []
-        for page in doc:
-            # DPI를 높여 글자 가독성 확보 (2배 확대)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_bytes = pix.tobytes("png")
-            base64_img = base64.b64encode(img_bytes).decode('utf-8')
-            base64_images.append(base64_img)
+    parsed = _parse(file_content, max_image_pages, max_text_chars)
+    if parsed["type"] == "text" and len(parsed["content"]) <= PARSE_CACHE_MAX_CHARS:
+        with _PARSE_CACHE_LOCK:
+            _PARSE_CACHE[cache_key] = parsed
+    return parsed
+
+
+def _content_digest(file_content: Union[bytes, str]) -> bytes:
+    if isinstance(file_content, str):
+        # 방금 쓴 임시 파일이라 페이지 캐시에서 읽힌다 (파싱보다 훨씬 저렴)
+        with open(file_content, "rb") as f:
+            return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).digest()
+    return hashlib.blake2b(file_content, digest_size=16).digest()
+
+
+def _parse(file_content: Union[bytes, str], max_image_pages: Optional[int], max_text_chars: Optional[int]):
+    pool = _get_pool()
+    if pool is None:
+        return _extract_content(file_content, max_image_pages, max_text_chars)
+
+    try:
+        text, page_count = pool.submit(_extract_text, file_content, max_text_chars).result()
+        if not _is_scanned(text):
+            return {"type": "text", "content": text}
+
+        render_count = _render_count(page_count, max_image_pages)
+        logger.info("스캔본 PDF 감지: %d/%d페이지 이미지 변환 시작", render_count, page_count)
+        with _as_path(file_content) as pdf_path:
+            base64_images = list(pool.map(_render_page, repeat(pdf_path, render_count), range(render_count)))
         return {"type": "images", "content": base64_images}
-    
-    return {"type": "text", "content": text}
\ No newline at end of file
+    except BrokenProcessPool:
+        # 워커가 비정상 종료되면 풀을 버리고 이번 요청은 현재 스레드에서 처리 (다음 요청 때 새 풀 생성)
+        logger.warning("PDF 파싱 프로세스 풀이 종료되어 현재 스레드에서 처리합니다.")
+        shutdown_pool()
+        return _extract_content(file_content, max_image_pages, max_text_chars)
+
+
+@contextmanager
+def _as_path(file_content: Union[bytes, str]):
+    # 페이지별 작업에 PDF 바이트를 넘기면 페이지 수만큼 통째로 피클링/복사되므로 임시 파일에 한 번 쓰고 경로만 넘긴다
+    if isinstance(file_content, str):
+        yield file_content
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(file_content)
+    try:
+        yield f.name
+    finally:
+        os.remove(f.name)
+
+
+def _open_pdf(file_content: Union[bytes, str]):
+    if isinstance(file_content, str):
+        return fitz.open(file_content, filetype="pdf")
+    return fitz.open(stream=file_content, filetype="pdf")
+
+
+def _is_scanned(text: str) -> bool:
+    # 텍스트가 50자 미만이면 스캔본으로 간주
+    return len(text.strip()) < 50
+
+
+def _render_count(page_count: int, max_image_pages: Optional[int]) -> int:
+    if max_image_pages is None:
+        return page_count
+    return min(page_count, max(max_image_pages, 0))
+
+
+def _page_to_base64(page) -> str:
+    # DPI를 높여 글자 가독성 확보 (2배 확대)
+    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+    img_bytes = pix.tobytes("jpg", jpg_quality=SCAN_JPEG_QUALITY)
+    return base64.b64encode(img_bytes).decode('utf-8')
+
+
+def _collect_text(doc, max_text_chars: Optional[int]) -> str:
+    parts = []
+    total = 0
+    for page in doc:
+        text = page.get_text()
+        parts.append(text)
+        total += len(text)
+        if max_text_chars is not None and total >= max_text_chars:
+            break
+    return "".join(parts)
+
+
+def _extract_text(file_content: Union[bytes, str], max_text_chars: Optional[int] = None) -> tuple[str, int]:
+    with _open_pdf(file_content) as doc:
+        return _collect_text(doc, max_text_chars), doc.page_count
+
+
+def _render_page(file_content: Union[bytes, str], page_index: int) -> str:
+    with _open_pdf(file_content) as doc:
+        return _page_to_base64(doc[page_index])
+
+
+def _extract_content(
+    file_content: Union[bytes, str],
+    max_image_pages: Optional[int] = None,
+    max_text_chars: Optional[int] = None,
+):
+    """풀 없이 현재 스레드에서 처리 (문서를 한 번만 연다)."""
+    with _open_pdf(file_content) as doc:
+        text = _collect_text(doc, max_text_chars)
+        if not _is_scanned(text):
+            return {"type": "text", "content": text}
+
+        render_count = _render_count(doc.page_count, max_image_pages)
+        logger.info("스캔본 PDF 감지: %d/%d페이지 이미지 변환 시작", render_count, doc.page_count)
+        return {"type": "images", "content": [_page_to_base64(page) for page in doc.pages(0, render_count)]}
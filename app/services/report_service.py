@@ -0,0 +1,189 @@
+# app/services/report_service.py
+# AI 분석 결과 저장 공통 로직 (커밋은 호출 측에서)
+# - save_analysis_report: general / real_estate 라우터 (Document → 종합 요약 조항/분석 → 개별 조항/분석 → 완료 알림)
+# - save_clause_results: /api/analyze 동기/배치 분석 (조항/분석 → 임베딩 → 완료 알림)
+# - 둘 다 커밋 후 해당 사용자의 채팅 응답 캐시/인메모리 인덱스를 비운다 (문서 전체 범위 상담 컨텍스트가 바뀌므로)
+
+import uuid
+from typing import Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from app.models.contract import Clause, ClauseAnalysis, Document
+from app.rag import memory_index
+from app.rag.vectorstore import upsert_clause_embeddings
+from app.services import semantic_cache
+from app.services.notification_service import create_analysis_done_notification
+
+
+def _invalidate_user_caches_on_commit(db: Session, user_id: uuid.UUID) -> None:
+    # 커밋 전에 비우면 그 사이 들어온 첫 질문이 이전 상태로 다시 캐시될 수 있으므로 커밋 직후에 비운다
+    def _invalidate(session) -> None:
+        semantic_cache.invalidate_user(user_id)
+        memory_index.invalidate_user(user_id)
+
+    event.listen(db, "after_commit", _invalidate, once=True)
+
+
+def save_analysis_report(
+    db: Session,
+    *,
+    owner_id: uuid.UUID,
+    filename: str,
+    summary_clause_number: str,
+    summary_body: str,
+    report_title: str,
+    summary_text: str,
+    is_valid_contract: bool,
+    summary_data: Optional[dict],
+    overall_comment: str,
+    clauses_data: list,
+) -> tuple[Document, int]:
+    """분석 결과를 저장하고 (문서, 위험 조항 수)를 반환한다."""
+    # 계약서가 아니더라도 'done' 상태로 저장하여 결과 화면을 보여줌
+    new_doc = Document(
+        id=uuid.uuid4(),
+        filename=filename,
+        owner_id=owner_id,
+        status='done',
+    )
+    db.add(new_doc)
+
+    # 종합 요약 조항 저장 (필수)
+    summary_clause = Clause(
+        id=uuid.uuid4(),
+        document_id=new_doc.id,
+        clause_number=summary_clause_number,
+        title=report_title,
+        body=summary_body if is_valid_contract else "분석이 거절되었습니다.",
+    )
+    db.add(summary_clause)
+
+    # 위험도 점수 설정
+    if not is_valid_contract:
+        # 계약서가 아니면 점수는 0점 처리하되, 위험도는 LOW로 표시 (빨간색보다는 회색/초록색으로 뜨게)
+        summary_risk_level = 'LOW'
+    else:
+        summary_data = summary_data or {}
+        summary_risk = summary_data.get("total_score", 0)
+        summary_risk_level = 'HIGH' if summary_risk == 0 or summary_data.get("risk_count", 0) > 0 else 'LOW'
+
+    summary_analysis = ClauseAnalysis(
+        id=uuid.uuid4(),
+        clause_id=summary_clause.id,
+        risk_level=summary_risk_level,
+        summary=summary_text,
+        suggestion=overall_comment,  # 분석 불가인 경우 "계약서가 아닙니다" 등 AI 메시지가 들어감
+    )
+    db.add(summary_analysis)
+    db.flush()  # 아래 일괄 INSERT가 참조할 문서/요약 행을 먼저 기록
+
+    # 개별 조항 저장 (정상 계약서일 때만 데이터가 있음)
+    # PK를 미리 만들어 두고 조항/분석을 각각 한 번의 INSERT(executemany)로 저장
+    risk_count = 0
+    clause_rows = []
+    analysis_rows = []
+    for item in clauses_data:
+        if not isinstance(item, dict):
+            continue
+
+        clause_risk = item.get("risk_level", "LOW")
+        if clause_risk == "HIGH":
+            risk_count += 1
+
+        clause_id = uuid.uuid4()
+        clause_rows.append({
+            "id": clause_id,
+            "document_id": new_doc.id,
+            "clause_number": item.get("article_number", item.get("clause_number", "미분류")),
+            "title": item.get("title", "제목 없음"),
+            "body": item.get("original_text", item.get("body", "")),
+        })
+
+        # legal_basis 태그 저장
+        tags_data = []
+        legal_basis = item.get("legal_basis", "")
+        if legal_basis:
+            tags_data.append({"legal_basis": legal_basis})
+
+        analysis_rows.append({
+            "id": uuid.uuid4(),
+            "clause_id": clause_id,
+            "risk_level": clause_risk,
+            "summary": item.get("analysis", item.get("summary", "")),
+            "suggestion": item.get("suggestion", ""),
+            "tags": tags_data,
+        })
+
+    if clause_rows:
+        db.execute(insert(Clause), clause_rows)
+        db.execute(insert(ClauseAnalysis), analysis_rows)
+
+    # 알림 생성
+    create_analysis_done_notification(
+        db=db,
+        user_id=owner_id,
+        document_id=new_doc.id,
+        filename=new_doc.filename,
+        risk_count=risk_count,
+    )
+    _invalidate_user_caches_on_commit(db, owner_id)
+    return new_doc, risk_count
+
+
+def save_clause_results(db: Session, *, document: Document, clauses_data: list) -> int:
+    """analyzer 결과(clauses)를 문서에 저장하고 위험 조항 수를 반환한다. (문서 행은 이미 기록돼 있어야 함)"""
+    # PK를 미리 만들어 두고 조항/분석을 각각 한 번의 INSERT(executemany)로 저장
+    risk_count = 0
+    clause_rows = []
+    analysis_rows = []
+    for item in clauses_data:
+        if not isinstance(item, dict):
+            continue
+
+        risk_level = item.get('risk_level', 'LOW')
+        if risk_level == 'HIGH':
+            risk_count += 1
+
+        clause_id = uuid.uuid4()
+        clause_rows.append({
+            'id': clause_id,
+            'document_id': document.id,
+            'clause_number': item.get('clause_number', '미분류'),
+            'title': item.get('title', '제목 없음'),
+            'body': item.get('body', ''),
+        })
+        analysis_rows.append({
+            'id': uuid.uuid4(),
+            'clause_id': clause_id,
+            'risk_level': risk_level,
+            'summary': item.get('summary', ''),
+            'suggestion': item.get('suggestion', ''),
+        })
+
+    if clause_rows:
+        db.execute(insert(Clause), clause_rows)
+        db.execute(insert(ClauseAnalysis), analysis_rows)
+
+    # 임베딩 텍스트/Qdrant payload 생성용 (세션에 추가하지 않는 transient 객체)
+    # 조항별 호출 대신 임베딩 배치 요청 1회 + Qdrant 일괄 업로드
+    upsert_clause_embeddings(
+        db=db,
+        pairs=[
+            (Clause(**clause_row), ClauseAnalysis(**analysis_row))
+            for clause_row, analysis_row in zip(clause_rows, analysis_rows)
+        ],
+        user_id=document.owner_id,
+        document_id=document.id,
+    )
+
+    create_analysis_done_notification(
+        db=db,
+        user_id=document.owner_id,
+        document_id=document.id,
+        filename=document.filename,
+        risk_count=risk_count,
+    )
+    _invalidate_user_caches_on_commit(db, document.owner_id)
+    return risk_count
@@ -0,0 +1,126 @@
+# app/services/semantic_cache.py
+# 첫 질문 응답 캐시 (semantic cache)
+# - 같은 사용자/문서 범위에서 의미가 거의 같은 질문(코사인 ≥ 임계값)이면 검색 + GPT 호출을 생략하고 이전 답변을 재사용
+# - 대화 히스토리에 따라 답이 달라지므로 히스토리가 없는 첫 질문에만 사용한다
+# - 사용자의 임베딩/분석 결과가 바뀌면(문서 추가/삭제) 해당 사용자 캐시를 비우고, 나머지는 TTL로 만료
+# - 캐시와 무효화는 프로세스 단위라 WEB_CONCURRENCY>1이면 다른 워커의 캐시는 TTL(TTL_SECONDS)까지 남을 수 있다
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import event
+
+from app.models.contract import ClauseEmbedding
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+TTL_SECONDS = 600
+MAX_SCOPES = 256
+MAX_ENTRIES_PER_SCOPE = 32
+
+# (user_id, document_id, top_k, min_similarity, use_rerank)
+Scope = tuple[uuid.UUID, Optional[uuid.UUID], int, float, bool]
+
+
+@dataclass
+class _Entry:
+    embedding: np.ndarray  # L2 정규화된 질문 임베딩
+    content: str
+    citations: list
+    expires_at: float
+
+
+@dataclass
+class _Bucket:
+    entries: list[_Entry] = field(default_factory=list)
+    matrix: Optional[np.ndarray] = None  # entries 임베딩을 쌓은 (N, D) 행렬, 항목이 바뀔 때만 다시 만든다
+
+
+_SCOPES: "OrderedDict[Scope, _Bucket]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _normalize(embedding: list[float]) -> Optional[np.ndarray]:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    if vec.size == 0 or norm == 0.0:
+        return None
+    return vec / norm
+
+
+def lookup(scope: Scope, embedding: list[float]) -> Optional[tuple[str, list]]:
+    """가장 유사한 캐시 항목이 임계값 이상이면 (답변, citations)를 반환."""
+    query = _normalize(embedding)
+    if query is None:
+        return None
+
+    now = time.monotonic()
+    with _LOCK:
+        bucket = _SCOPES.get(scope)
+        if bucket is None:
+            return None
+        live = [e for e in bucket.entries if e.expires_at > now]
+        if len(live) != len(bucket.entries):
+            bucket.entries = live
+            bucket.matrix = None
+        if not live:
+            del _SCOPES[scope]
+            return None
+        _SCOPES.move_to_end(scope)
+
+        if bucket.matrix is None:
+            bucket.matrix = np.stack([e.embedding for e in live])
+        if bucket.matrix.shape[1] != query.shape[0]:
+            return None
+        # 정렬 없이 행렬곱 1회 + argmax로 최근접 항목만 찾는다
+        scores = bucket.matrix @ query
+        best = int(np.argmax(scores))
+        if float(scores[best]) < SIMILARITY_THRESHOLD:
+            return None
+        entry = live[best]
+        return entry.content, list(entry.citations)
+
+
+def store(scope: Scope, embedding: list[float], content: str, citations: list) -> None:
+    vec = _normalize(embedding)
+    if vec is None:
+        return
+
+    entry = _Entry(
+        embedding=vec,
+        content=content,
+        citations=list(citations),
+        expires_at=time.monotonic() + TTL_SECONDS,
+    )
+    with _LOCK:
+        bucket = _SCOPES.setdefault(scope, _Bucket())
+        bucket.entries = [e for e in bucket.entries if e.embedding.shape == vec.shape]
+        bucket.entries.append(entry)
+        del bucket.entries[:-MAX_ENTRIES_PER_SCOPE]
+        bucket.matrix = None
+        _SCOPES.move_to_end(scope)
+        while len(_SCOPES) > MAX_SCOPES:
+            _SCOPES.popitem(last=False)
+
+
+def invalidate_user(user_id: Optional[uuid.UUID]) -> None:
+    if user_id is None:
+        return
+    with _LOCK:
+        for scope in [s for s in _SCOPES if s[0] == user_id]:
+            del _SCOPES[scope]
+
+
+@event.listens_for(ClauseEmbedding, "after_insert")
+@event.listens_for(ClauseEmbedding, "after_update")
+@event.listens_for(ClauseEmbedding, "after_delete")
+def _on_embedding_change(mapper, connection, target: ClauseEmbedding) -> None:
+    invalidate_user(target.user_id)